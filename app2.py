@@ -19,6 +19,7 @@ from pydub import AudioSegment
 from flask import Flask, request
 from dotenv import load_dotenv
 from utils_sheets import registrar_pago, obtener_hashes_existentes
+from services.rate_limiter import crear_rate_limiter
 import fitz
 from waitress import serve
 
@@ -170,49 +171,13 @@ def notificar_grupo_soporte(cliente_id, nombre_cliente, tipo_problema, telefono_
         return False
 
 # --- SISTEMA DE RATE LIMITING ---
-RATE_LIMIT_FILE = "rate_limits.json"
-
-def get_rate_limit_data():
-    try:
-        with open(RATE_LIMIT_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
-def save_rate_limit_data(data):
-    try:
-        with open(RATE_LIMIT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error guardando rate limits: {e}")
+rate_limiter = crear_rate_limiter(BOT_CONFIG['max_messages_per_minute'], window_seconds=60)
 
 def check_rate_limit(user_id):
     try:
-        data = get_rate_limit_data()
-        now = datetime.now()
-        cutoff = now - timedelta(hours=1)
-        for uid in list(data.keys()):
-            user_data = data[uid]
-            user_data['timestamps'] = [
-                ts for ts in user_data.get('timestamps', [])
-                if datetime.fromisoformat(ts) > cutoff
-            ]
-            if not user_data['timestamps']:
-                del data[uid]
-        if user_id not in data:
-            data[user_id] = {'timestamps': []}
-        user_data = data[user_id]
-        minute_ago = now - timedelta(minutes=1)
-        recent_timestamps = [
-            ts for ts in user_data['timestamps']
-            if datetime.fromisoformat(ts) > minute_ago
-        ]
-        if len(recent_timestamps) >= BOT_CONFIG['max_messages_per_minute']:
-            return False, f"Has alcanzado el límite de {BOT_CONFIG['max_messages_per_minute']} mensajes por minuto. Por favor, espera un momento."
-        user_data['timestamps'] = recent_timestamps + [now.isoformat()]
-        data[user_id] = user_data
-        save_rate_limit_data(data)
-        return True, ""
+        if rate_limiter.permitir(user_id):
+            return True, ""
+        return False, f"Has alcanzado el límite de {BOT_CONFIG['max_messages_per_minute']} mensajes por minuto. Por favor, espera un momento."
     except Exception as e:
         print(f"Error en rate limiting: {e}")
         return True, ""
@@ -0,0 +1,41 @@
+# benchmarks/__main__.py
+# Uso:
+#   python -m benchmarks                          # casos de comprobantes + bases de 4k y 100k filas
+#   python -m benchmarks --tamanos 4k,100k,1m     # incluye la base de 1M filas (tarda y usa varios GB)
+#   python -m benchmarks --solo "buscar_*"        # filtra casos por nombre (fnmatch)
+#   python -m benchmarks --guardar benchmarks/linea_base.json
+#   python -m benchmarks --comparar benchmarks/linea_base.json   # sale con código 1 si algo empeoró
+# La prueba de que extraer_campos escala en línea con el texto está en benchmarks/extractor_lineal.py.
+# Las diferencias con las funciones de regex anteriores las controla benchmarks/extractor_diferencial.py.
+# Que los imports entre módulos del proyecto resuelvan lo verifica benchmarks/importaciones.py.
+import argparse
+import sys
+import tempfile
+
+from benchmarks import suite
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Micro-benchmarks de las funciones puras del bot.")
+    parser.add_argument("--tamanos", default="4k,100k", help="tamaños de la base de clientes, p. ej. 4k,100k,1m")
+    parser.add_argument("--solo", default="*", help="patrón fnmatch sobre el nombre del caso")
+    parser.add_argument("--segundos", type=float, default=0.5, help="tiempo mínimo de medición por caso")
+    parser.add_argument("--guardar", metavar="JSON", help="guarda los resultados como línea base")
+    parser.add_argument("--comparar", metavar="JSON", help="compara contra una línea base guardada")
+    parser.add_argument("--umbral", type=float, default=0.2, help="empeoramiento tolerado al comparar (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    tamanos = [suite.leer_tamano(t) for t in args.tamanos.split(",") if t.strip()]
+    with tempfile.TemporaryDirectory(prefix="bench_bot_") as directorio:
+        resultados = suite.ejecutar(tamanos, directorio, args.solo, args.segundos)
+
+    if args.guardar:
+        suite.guardar_linea_base(resultados, args.guardar)
+    if args.comparar:
+        regresiones = suite.comparar_con_linea_base(resultados, args.comparar, args.umbral)
+        if regresiones:
+            print(f"\n[bench] {len(regresiones)} casos más lentos que la línea base (umbral {args.umbral:.0%}).")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# benchmarks/extractor_diferencial.py
+# Compara extraer_campos con las funciones de expresiones regulares que reemplazó
+# (copiadas abajo tal cual estaban en app.py) sobre casos fijos, los comprobantes
+# sintéticos de benchmarks/corpus.py y textos aleatorios. Solo se aceptan las
+# diferencias intencionales documentadas en DIFERENCIAS; cualquier otra se lista.
+# Uso: python -m benchmarks.extractor_diferencial [textos_aleatorios]   (código 1 si hay diferencias)
+import random
+import re
+import sys
+from datetime import datetime
+
+from bot.receipt_extractor import extraer_campos, ETIQUETAS_DOCUMENTO
+from benchmarks import corpus
+
+# --- FUNCIONES ANTERIORES (referencia) ---
+def buscar_monto_anterior(texto_completo):
+    if not texto_completo: return "0.00"
+    patrones_monto = [r'(?:monto|valor|total|pago)\s*:?\s*(?:usd|\$)?\s*([\d,]+\.\d{2})', r'(?:usd|\$)\s*([\d,]+\.\d{2})']
+    montos_encontrados = []
+    for patron in patrones_monto:
+        matches = re.findall(patron, texto_completo, re.IGNORECASE)
+        for match in matches:
+            montos_encontrados.append(float(match.replace(',', '')))
+    if montos_encontrados: return f"{max(montos_encontrados):.2f}"
+    matches_generales = re.findall(r'([\d,]+\.\d{2})', texto_completo)
+    for match in matches_generales:
+        try:
+            if float(match.replace(',', '')) > 0: montos_encontrados.append(float(match.replace(',', '')))
+        except ValueError: continue
+    return f"{max(montos_encontrados):.2f}" if montos_encontrados else "0.00"
+
+def buscar_fecha_anterior(texto_completo):
+    if not texto_completo: return datetime.now().strftime("%d/%m/%Y")
+    texto_lower = texto_completo.lower()
+    meses_es = {'ene': '01', 'feb': '02', 'mar': '03', 'abr': '04', 'may': '05', 'jun': '06', 'jul': '07', 'ago': '08', 'sep': '09', 'oct': '10', 'nov': '11', 'dic': '12'}
+    match = re.search(r'(\d{1,2})[/\s-]([a-zA-Z]{3})[/\s-](\d{2,4})', texto_lower)
+    if match: d, M, y = match.groups(); return f"{d.zfill(2)}/{meses_es.get(M, '00')}/{'20' + y if len(y) == 2 else y}"
+    match = re.search(r'(\d{4})[/\s-]([a-zA-Z]{3})[/\s-](\d{1,2})', texto_lower)
+    if match: y, M, d = match.groups(); return f"{d.zfill(2)}/{meses_es.get(M, '00')}/{y}"
+    match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})', texto_lower)
+    if match: d, m, y = match.groups(); return f"{d.zfill(2)}/{m.zfill(2)}/{'20' + y if len(y) == 2 else y}"
+    match = re.search(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', texto_lower)
+    if match: y, m, d = match.groups(); return f"{d.zfill(2)}/{m.zfill(2)}/{y}"
+    return datetime.now().strftime("%d/%m/%Y")
+
+def buscar_numero_documento_anterior(texto_completo):
+    if not texto_completo: return "No encontrado"
+    texto_normalizado = re.sub(r'[^\w\s.]', ' ', texto_completo).lower()
+    nombres_bancos = ['pichincha', 'guayaquil', 'produbanco', 'jep', 'jardin azuayo', 'bolivariano', 'pacifico', 'internacional']
+    patrones = [r'\bno\.(jm\d{4}[a-z]{3}\d+)\b', r'\bno\.\s*([a-zA-Z0-9]{10,})\b', r'(?:No\.|Nro\.)?\s*Transacci[oó]n\s*:?#?\s*([a-zA-Z0-9-]{6,25})\b', r'Cod\.\s*Movimiento\s*:?\s*([a-zA-Z0-9]{6,25})\b', r'(?:Comprobante|Ref|Secuencial|Documento)\.?\s*:?\s*([a-zA-Z0-9-]{6,25})\b', r'\b([a-zA-Z0-9]{7,25})\b(?=.*\d)', r'\b(\d{9,25})\b']
+    found_ids = []
+    for patron in patrones:
+        for match in re.finditer(patron, texto_normalizado, re.IGNORECASE):
+            doc_id = match.group(1) or match.group(0)
+            if doc_id.lower() in nombres_bancos or doc_id.lower() in ['numero', 'codigo', 'comprobante', 'referencia']: continue
+            if re.fullmatch(r'\d{1,3}(?:,\d{3})*\.\d{2}', doc_id) or re.fullmatch(r'\d{1,2}/\d{1,2}/\d{2,4}', doc_id): continue
+            if len(doc_id) >= 6 and (re.search(r'\d', doc_id) or len(doc_id) > 8): found_ids.append(doc_id)
+    return found_ids[0].upper() if found_ids else "No encontrado"
+
+# --- CASOS FIJOS ---
+# (texto, campo, valor esperado del extractor nuevo); None = igual que el anterior
+CASOS = [
+    ("Transferencia exitosa\nNo. documento : Comprobante documento\nMonto $25.00", "documento", "No encontrado"),
+    ("Comprobante: Referencia\nSecuencial documento\nTotal 10.00", "documento", "No encontrado"),
+    ("BANCO PICHINCHA\nNo. Transacción: 123456789\nMonto: $15.00", "documento", None),
+    ("JEP Móvil\nNo.JM1234ABC5678\nMonto transferido $ 20.00", "documento", None),
+    ("Fecha 2025-07-26\nTotal: 18.00", "fecha", "26/07/2025"),
+    ("Referencia: 12345678\nValor USD 30.00", "documento", "12345678"),
+    ("pago 23 usd 45.00", "fecha", "hoy"),
+]
+
+# Diferencias aceptadas, con la regla que las reconoce
+_ANIO_PRIMERO = re.compile(r'\d{4}(?:[/-]\d{1,2}[/-]|[/\s-][a-zA-Z]{3}[/\s-])\d{1,2}')
+_MES_FALSO = re.compile(r'\d{1,2}[/\s-]([a-zA-Z]{3})[/\s-]\d{2,4}|\d{4}[/\s-]([a-zA-Z]{3})[/\s-]\d{1,2}')
+_MONTO_O_FECHA = re.compile(r'[\d,]*\d\.\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}[/-]\d{1,2}[/-]\d{1,2}')
+_REFERENCIA = re.compile(r'referencia\W*\w{6,25}', re.IGNORECASE)
+
+def _mes_falso(texto):
+    return any((a or b).lower() not in ("ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sep", "oct", "nov", "dic")
+               for a, b in _MES_FALSO.findall(texto.lower()))
+
+DIFERENCIAS = {
+    "fecha con el año primero (aaaa-mm-dd, aaaa-mes-dd) se leía como dd/mm/aa": lambda campo, texto, viejo, nuevo: campo == "fecha" and _ANIO_PRIMERO.search(texto),
+    "mes en letras que no es un mes": lambda campo, texto, viejo, nuevo: campo == "fecha" and _mes_falso(texto),
+    "una etiqueta ('documento', 'ref'...) nunca es el número": lambda campo, texto, viejo, nuevo: campo == "documento" and viejo.lower() in ETIQUETAS_DOCUMENTO,
+    "'Referencia' ya no consume el número": lambda campo, texto, viejo, nuevo: campo == "documento" and _REFERENCIA.search(texto),
+    "montos y fechas nunca son documento": lambda campo, texto, viejo, nuevo: campo == "documento" and viejo != "No encontrado"
+        and any(viejo.lower() in m.replace(",", "") or m.replace(",", "").startswith(viejo.lower()) for m in _MONTO_O_FECHA.findall(texto.lower())),
+}
+
+def _valores(texto):
+    campos = extraer_campos.__wrapped__(texto)
+    hoy = datetime.now().strftime("%d/%m/%Y")
+    nuevo = {"monto": campos.monto, "fecha": campos.fecha or hoy, "documento": campos.documento}
+    viejo = {"monto": buscar_monto_anterior(texto), "fecha": buscar_fecha_anterior(texto),
+             "documento": buscar_numero_documento_anterior(texto)}
+    return viejo, nuevo
+
+def _textos_aleatorios(cantidad, semilla=7):
+    rnd = random.Random(semilla)
+    piezas = ["No.", "no", "Nro.", "Transacción:", "Cod.", "Movimiento", "Comprobante", "comprobante:", "Ref", "Ref.",
+              "Referencia:", "Secuencial", "Documento", "documento.", "Monto:", "valor", "Total", "pago", "usd", "$",
+              "25.00", "1,250.50", "0.00", "12/05/2025", "2025/05/12", "3 mar 2024", "2024-jul-09", "123456789",
+              "ABC12345", "JM1234ABC5678", "pichincha", "TRONCALNET", "transferencia", "exitosa", ":", "#", "-", "\n"]
+    return [" ".join(rnd.choice(piezas) for _ in range(rnd.randint(3, 25))) for _ in range(cantidad)]
+
+def verificar(aleatorios=5000):
+    errores, aceptadas = [], {}
+    hoy = datetime.now().strftime("%d/%m/%Y")
+    for texto, campo, esperado in CASOS:
+        viejo, nuevo = _valores(texto)
+        objetivo = viejo[campo] if esperado is None else (hoy if esperado == "hoy" else esperado)
+        if nuevo[campo] != objetivo:
+            errores.append((campo, texto, objetivo, nuevo[campo]))
+
+    textos = [t for banco in corpus.PLANTILLAS_BANCO for t in corpus.generar_comprobantes(banco, 300)]
+    textos += [t for t in _textos_aleatorios(aleatorios) if t not in {c[0] for c in CASOS}]
+    for texto in textos:
+        viejo, nuevo = _valores(texto)
+        for campo in ("monto", "fecha", "documento"):
+            if viejo[campo] == nuevo[campo]:
+                continue
+            motivo = next((m for m, regla in DIFERENCIAS.items() if regla(campo, texto, viejo[campo], nuevo[campo])), None)
+            if motivo:
+                aceptadas[motivo] = aceptadas.get(motivo, 0) + 1
+            else:
+                errores.append((campo, texto, viejo[campo], nuevo[campo]))
+    return len(textos) + len(CASOS), aceptadas, errores
+
+def main(argv):
+    aleatorios = int(argv[0]) if argv else 5000
+    total, aceptadas, errores = verificar(aleatorios)
+    for motivo, n in aceptadas.items():
+        print(f"[diferencial] {n:5d} diferencias aceptadas: {motivo}")
+    for campo, texto, viejo, nuevo in errores[:20]:
+        print(f"[diferencial] {campo}: anterior={viejo!r} nuevo={nuevo!r} en {texto!r}")
+    print(f"[diferencial] {total} textos, {len(errores)} diferencias no documentadas.")
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+# benchmarks/extractor_lineal.py
+# Mide extraer_campos con textos OCR cada vez más largos. Si el costo es lineal, el
+# tiempo por KB se mantiene parejo al duplicar el texto.
+# Uso: python -m benchmarks.extractor_lineal [repeticiones]
+import random
+import sys
+import time
+
+from bot.receipt_extractor import extraer_campos
+
+COMPROBANTE = (
+    "BANCO PICHINCHA\nComprobante de transferencia\nNo. Transacción: {doc}\n"
+    "Fecha: {dia}/03/2025\nMonto: ${monto}\nCuenta destino: 2200{cuenta}\n"
+    "Beneficiario: RODRIGUEZ QUINTEROS ISMAEL\nTRONCALNET\n"
+)
+# Una sola línea larga sin cifras: el peor caso del patrón anterior (\w{7,25}(?=.*\d))
+PALABRAS_SIN_CIFRAS = ["transferencia", "cuenta", "beneficiario", "valor", "pichincha", "destino", "bancario"]
+TAMANOS = [1, 2, 4, 8, 16, 32]
+
+def texto_varias_paginas(paginas, rnd):
+    return "".join(COMPROBANTE.format(doc=rnd.randrange(10**8, 10**9), dia=rnd.randint(10, 28),
+                                      monto=f"{rnd.randint(1, 300)}.{rnd.randint(0, 99):02d}",
+                                      cuenta=rnd.randrange(1000, 9999))
+                   for _ in range(paginas * 20))
+
+def texto_una_linea(paginas, rnd):
+    return " ".join(rnd.choice(PALABRAS_SIN_CIFRAS) for _ in range(paginas * 500))
+
+def medir(texto, repeticiones):
+    # Se llama a la función sin caché para medir el recorrido completo cada vez
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        extraer_campos.__wrapped__(texto)
+    return (time.perf_counter() - inicio) / repeticiones
+
+def main(repeticiones=5):
+    rnd = random.Random(12)
+    for nombre, generar in (("varias páginas", texto_varias_paginas), ("una línea sin cifras", texto_una_linea)):
+        print(f"\n[{nombre}]")
+        print(f"{'caracteres':>12} {'ms':>10} {'us/KB':>10}")
+        por_kb = []
+        for paginas in TAMANOS:
+            texto = generar(paginas, rnd)
+            segundos = medir(texto, repeticiones)
+            por_kb.append(segundos * 1e6 / (len(texto) / 1024))
+            print(f"{len(texto):>12} {segundos * 1e3:>10.2f} {por_kb[-1]:>10.1f}")
+        # Con costo cuadrático la relación crecería con el tamaño (32x más texto ~ 32x más us/KB)
+        relacion = max(por_kb) / min(por_kb)
+        print(f"us/KB máx/mín: {relacion:.2f} -> {'lineal' if relacion < 2 else 'NO lineal'}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,97 @@
+# benchmarks/importaciones.py
+# Verifica, sin ejecutar nada ni tener instaladas las dependencias, que cada
+# "from <módulo del proyecto> import nombre" apunte a algo definido en ese módulo.
+# Un nombre que falta rompe el import de app, tasks y de todo lo que importa el módulo.
+# Uso: python -m benchmarks.importaciones   (sale con código 1 si falta algún nombre)
+import ast
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULOS = ("app.py", "tasks.py", "utils_sheets.py", "services", "bot", "benchmarks")
+
+def archivos():
+    for nombre in MODULOS:
+        ruta = os.path.join(RAIZ, nombre)
+        if os.path.isdir(ruta):
+            for archivo in sorted(os.listdir(ruta)):
+                if archivo.endswith(".py"):
+                    yield os.path.join(ruta, archivo)
+        elif os.path.exists(ruta):
+            yield ruta
+
+def resolver(origen, nodo):
+    """Ruta del archivo del proyecto al que apunta un ImportFrom, o None si es externo."""
+    if nodo.level:
+        base = os.path.dirname(origen)
+        for _ in range(nodo.level - 1):
+            base = os.path.dirname(base)
+    else:
+        base = RAIZ
+    partes = (nodo.module or "").split(".") if nodo.module else []
+    ruta = os.path.join(base, *partes)
+    if os.path.isfile(ruta + ".py"):
+        return ruta + ".py"
+    if os.path.isfile(os.path.join(ruta, "__init__.py")):
+        return os.path.join(ruta, "__init__.py")
+    return None
+
+def nombres_definidos(arbol):
+    """Nombres de nivel de módulo, incluidos los definidos dentro de if/try/with."""
+    nombres = set()
+    pendientes = list(arbol.body)
+    while pendientes:
+        nodo = pendientes.pop()
+        if isinstance(nodo, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            nombres.add(nodo.name)
+        elif isinstance(nodo, (ast.Import, ast.ImportFrom)):
+            nombres.update((a.asname or a.name).split(".")[0] for a in nodo.names)
+        elif isinstance(nodo, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            objetivos = nodo.targets if isinstance(nodo, ast.Assign) else [nodo.target]
+            for objetivo in objetivos:
+                nombres.update(n.id for n in ast.walk(objetivo) if isinstance(n, ast.Name))
+        elif isinstance(nodo, (ast.If, ast.Try, ast.With, ast.For, ast.While)):
+            for campo in ("body", "orelse", "finalbody", "handlers"):
+                pendientes.extend(getattr(nodo, campo, []) or [])
+        elif isinstance(nodo, ast.ExceptHandler):
+            pendientes.extend(nodo.body)
+    return nombres
+
+def verificar():
+    arboles, faltantes = {}, []
+
+    def arbol(ruta):
+        if ruta not in arboles:
+            with open(ruta, encoding="utf-8") as f:
+                arboles[ruta] = ast.parse(f.read(), ruta)
+        return arboles[ruta]
+
+    for origen in archivos():
+        for nodo in ast.walk(arbol(origen)):
+            if not isinstance(nodo, ast.ImportFrom):
+                continue
+            destino = resolver(origen, nodo)
+            if destino is None:
+                continue
+            definidos = nombres_definidos(arbol(destino))
+            for alias in nodo.names:
+                if alias.name == "*" or alias.name in definidos:
+                    continue
+                # "from paquete import submodulo"
+                if os.path.basename(destino) == "__init__.py" and \
+                        os.path.isfile(os.path.join(os.path.dirname(destino), alias.name + ".py")):
+                    continue
+                faltantes.append((os.path.relpath(origen, RAIZ), nodo.lineno, alias.name, os.path.relpath(destino, RAIZ)))
+    return faltantes
+
+def main():
+    faltantes = verificar()
+    for origen, linea, nombre, destino in faltantes:
+        print(f"[importaciones] {origen}:{linea}: '{nombre}' no está definido en {destino}")
+    if faltantes:
+        return 1
+    print("[importaciones] Todos los imports entre módulos del proyecto resuelven.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
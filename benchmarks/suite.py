@@ -0,0 +1,182 @@
+# benchmarks/suite.py
+# Definición de los benchmarks y la medición. Cada caso es una función pura llamada
+# con un conjunto de entradas sintéticas (ver corpus.py); se reporta ops/s, p50/p99
+# por llamada y el pico de memoria (tracemalloc) de una pasada.
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import corpus
+
+COMPROBANTES_POR_BANCO = 200   # más que la caché de 64 de analizar_texto/extraer_campos
+CONSULTAS = 500
+LLAMADAS_MEMORIA = 50
+
+class Caso:
+    """Un benchmark: nombre 'funcion[variante]', la función y sus entradas."""
+
+    def __init__(self, nombre, funcion, entradas, min_llamadas=20):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entradas = entradas
+        self.min_llamadas = min_llamadas
+
+def medir(caso, segundos=0.5, max_llamadas=100000):
+    funcion, entradas = caso.funcion, caso.entradas
+    funcion(entradas[0])  # calentamiento (imports perezosos, cachés de re)
+    latencias = []
+    reloj = time.perf_counter_ns
+    limite = reloj() + int(segundos * 1e9)
+    i = 0
+    while (i < caso.min_llamadas or reloj() < limite) and i < max_llamadas:
+        entrada = entradas[i % len(entradas)]
+        inicio = reloj()
+        funcion(entrada)
+        latencias.append(reloj() - inicio)
+        i += 1
+
+    # La memoria se mide aparte: tracemalloc hace más lentas las llamadas
+    tracemalloc.start()
+    for entrada in entradas[:LLAMADAS_MEMORIA]:
+        funcion(entrada)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencias.sort()
+    total_s = sum(latencias) / 1e9
+    return {
+        "llamadas": len(latencias),
+        "ops_s": round(len(latencias) / total_s, 1) if total_s else None,
+        "p50_us": round(statistics.median(latencias) / 1e3, 2),
+        "p99_us": round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] / 1e3, 2),
+        "pico_kb": round(pico / 1024, 1),
+    }
+
+# --- CASOS ---
+def casos_comprobantes():
+    from bot.receipt_matcher import identificar_banco, es_comprobante_valido
+    from bot.receipt_extractor import buscar_monto, buscar_fecha, buscar_numero_documento
+    funciones = [buscar_monto, buscar_fecha, buscar_numero_documento, identificar_banco, es_comprobante_valido]
+    for banco in corpus.PLANTILLAS_BANCO:
+        textos = corpus.generar_comprobantes(banco, COMPROBANTES_POR_BANCO)
+        for funcion in funciones:
+            yield Caso(f"{funcion.__name__}[{banco}]", funcion, textos)
+
+def casos_intencion():
+    from bot.receipt_matcher import analizar_intencion
+    yield Caso("analizar_intencion[mensajes]", analizar_intencion, corpus.generar_mensajes(COMPROBANTES_POR_BANCO))
+
+def casos_clientes(filas, directorio):
+    from bot import client_service
+    path = os.path.join(directorio, f"base_clientes_{filas}.txt")
+    clientes = corpus.generar_base_clientes(filas, path)
+    indice = client_service.ClientIndex(path)
+    indice._vigente()  # la carga inicial se mide en su propio caso
+    anterior = client_service._client_index
+    client_service._client_index = indice
+    try:
+        etiqueta = etiqueta_tamano(filas)
+        yield Caso(f"cargar_clientes[{etiqueta}]", lambda p: client_service.ClientIndex(p)._cargar(), [path], min_llamadas=1)
+        consultas = corpus.consultas_por_nombre(clientes, CONSULTAS)
+        yield Caso(f"buscar_id_por_nombre[{etiqueta}]", client_service.buscar_id_por_nombre, consultas)
+        cedulas = [c for c, _ in clientes[:: max(1, filas // CONSULTAS)]] + ["0000000000"]
+        yield Caso(f"buscar_nombre_por_id[{etiqueta}]", client_service.buscar_nombre_por_id, cedulas)
+    finally:
+        client_service._client_index = anterior
+
+def casos_deuda(filas, directorio):
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        print("[bench] pandas no está instalado: se omite consultar_deuda.")
+        return
+    import utils_sheets
+    carpeta = os.path.join(directorio, f"deuda_{filas}")
+    os.makedirs(carpeta, exist_ok=True)
+    clientes = corpus.generar_base_clientes(filas, os.path.join(carpeta, "base_clientes.txt"))
+    corpus.generar_deuda_csv(clientes, os.path.join(carpeta, "deuda_clientes.csv"))
+    # utils_sheets busca deuda_clientes.* en el directorio actual
+    anterior = os.getcwd()
+    os.chdir(carpeta)
+    try:
+        utils_sheets._deuda_cache["firma"] = None
+        utils_sheets._get_deuda_table()
+        consultas = [c for c, _ in clientes[:: max(1, filas // CONSULTAS)]]
+        consultas += corpus.consultas_por_nombre(clientes, max(10, CONSULTAS // 10))
+        yield Caso(f"consultar_deuda[{etiqueta_tamano(filas)}]", utils_sheets.consultar_deuda, consultas)
+    finally:
+        os.chdir(anterior)
+
+def etiqueta_tamano(filas):
+    if filas >= 1_000_000 and filas % 1_000_000 == 0:
+        return f"{filas // 1_000_000}m"
+    return f"{filas // 1000}k" if filas % 1000 == 0 else str(filas)
+
+def leer_tamano(texto):
+    texto = texto.strip().lower()
+    multiplicador = {"k": 1000, "m": 1_000_000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip("km")) * multiplicador)
+
+def ejecutar(tamanos, directorio, patron="*", segundos=0.5):
+    """Corre los casos cuyo nombre coincide con el patrón y devuelve {nombre: métricas}."""
+    resultados = {}
+
+    def correr(casos):
+        for caso in casos:
+            if not fnmatch.fnmatch(caso.nombre, patron):
+                continue
+            resultados[caso.nombre] = metricas = medir(caso, segundos)
+            print(f"{caso.nombre:<42} {metricas['ops_s']:>12,.1f} {metricas['p50_us']:>10.1f} "
+                  f"{metricas['p99_us']:>10.1f} {metricas['pico_kb']:>10.1f}")
+
+    print(f"{'caso':<42} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10} {'pico KB':>10}")
+    correr(casos_comprobantes())
+    correr(casos_intencion())
+    for filas in tamanos:
+        etiqueta = etiqueta_tamano(filas)
+        if not any(fnmatch.fnmatch(f"{nombre}[{etiqueta}]", patron) for nombre in
+                   ("cargar_clientes", "buscar_id_por_nombre", "buscar_nombre_por_id", "consultar_deuda")):
+            continue  # generar 1M filas tarda; no se hace si ningún caso de ese tamaño se va a correr
+        correr(casos_clientes(filas, directorio))
+        correr(casos_deuda(filas, directorio))
+    return resultados
+
+# --- LÍNEA BASE ---
+def guardar_linea_base(resultados, path):
+    datos = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "maquina": platform.machine(),
+        "resultados": resultados,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"[bench] Línea base guardada en {path} ({len(resultados)} casos).")
+
+def comparar_con_linea_base(resultados, path, umbral=0.2):
+    """Imprime el cambio contra la línea base y devuelve los casos que empeoraron más que el umbral."""
+    with open(path, encoding="utf-8") as f:
+        base = json.load(f)["resultados"]
+    regresiones = []
+    print(f"\n{'caso':<42} {'ops/s':>10} {'p99':>10} {'pico':>10}")
+    for nombre, actual in resultados.items():
+        anterior = base.get(nombre)
+        if not anterior:
+            print(f"{nombre:<42} {'(nuevo)':>10}")
+            continue
+        cambio_ops = actual["ops_s"] / anterior["ops_s"] - 1 if anterior["ops_s"] else 0.0
+        cambio_p99 = actual["p99_us"] / anterior["p99_us"] - 1 if anterior["p99_us"] else 0.0
+        cambio_pico = actual["pico_kb"] / anterior["pico_kb"] - 1 if anterior["pico_kb"] else 0.0
+        peor = cambio_ops < -umbral or cambio_p99 > umbral
+        if peor:
+            regresiones.append(nombre)
+        print(f"{nombre:<42} {cambio_ops:>+10.1%} {cambio_p99:>+10.1%} {cambio_pico:>+10.1%}{'  <-- más lento' if peor else ''}")
+    faltantes = set(base) - set(resultados)
+    if faltantes:
+        print(f"({len(faltantes)} casos de la línea base no se corrieron en esta medición)")
+    return regresiones
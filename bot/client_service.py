@@ -1,7 +1,16 @@
 # Al inicio de bot/client_service.py
+import os
+import threading
 import unicodedata
 import re
-import random
+from collections import Counter
+
+CLIENTES_FILE = 'base_clientes.txt'
+# Límites de Speech para las pistas de frases de una petición
+SPEECH_MAX_FRASES = 5000
+SPEECH_MAX_CARACTERES = 100000
+# Palabras de los nombres que no sirven como pista por sí solas
+_PARTICULAS = {"DEL", "LOS", "LAS"}
 
 # --- FUNCIONES DE VALIDACIÓN Y EXTRACCIÓN ---
 def parse_client_line(line):
@@ -16,54 +25,146 @@ def parse_client_line(line):
     except Exception:
         return None, None
 
-def get_client_phrases():
-    phrases = []
-    try:
-        with open('base_clientes.txt', 'r', encoding='utf-8') as f:
+def limpiar_texto(texto):
+    nfkd_form = unicodedata.normalize('NFKD', texto.lower())
+    texto_limpio = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
+    return re.sub(r'[^a-z0-9\s]', '', texto_limpio)
+
+# --- ÍNDICE EN MEMORIA DE LA BASE DE CLIENTES ---
+class ClientIndex:
+    """
+    Carga base_clientes.txt una sola vez y lo mantiene indexado:
+    - por_id: cédula/RUC -> nombre (se conserva la primera aparición, igual que la búsqueda lineal).
+    - por_palabra: palabra normalizada -> posiciones de las filas que la contienen.
+    Se recarga solo cuando cambia el mtime del archivo; las pistas para Speech se
+    recalculan a partir del índice vigente, así que siguen el mismo ciclo.
+    """
+
+    def __init__(self, path=CLIENTES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        # (por_id, filas, por_palabra) se reemplaza completo para que los lectores nunca vean un índice a medias
+        self._datos = ({}, [], {})
+        self._frases = (None, ())  # (datos con que se calcularon, frases)
+
+    def _cargar(self):
+        por_id = {}
+        filas = []
+        por_palabra = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
             for line in f:
-                _, nombre = parse_client_line(line)
-                if nombre:
-                    if len(nombre) <= 100:
-                        phrases.append(nombre)
-                    name_parts = nombre.split()
-                    if len(name_parts) > 1:
-                        if len(name_parts[0]) <= 100:
-                            phrases.append(name_parts[0])
-                        if len(name_parts[-1]) <= 100:
-                            phrases.append(name_parts[-1])
-        
-        unique_phrases = list(set(phrases))
-        
-        random.shuffle(unique_phrases)
-        
-        final_phrases = []
-        total_chars = 0
-        
-        for phrase in unique_phrases:
-            if len(final_phrases) < 5000 and (total_chars + len(phrase)) < 100000:
-                final_phrases.append(phrase)
-                total_chars += len(phrase)
+                id_base, nombre_base = parse_client_line(line)
+                if not (id_base and nombre_base):
+                    continue
+                por_id.setdefault(id_base, nombre_base)
+                palabras = frozenset(limpiar_texto(nombre_base).split())
+                pos = len(filas)
+                filas.append((id_base, nombre_base, palabras))
+                for palabra in palabras:
+                    por_palabra.setdefault(palabra, []).append(pos)
+        return por_id, filas, por_palabra
+
+    def _vigente(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._datos = self._cargar()
+                    self._mtime = mtime
+                    print(f"[clientes] Índice cargado: {len(self._datos[1])} clientes.")
+        return self._datos
+
+    def nombre_por_id(self, identificacion):
+        por_id, _, _ = self._vigente()
+        return por_id.get(identificacion)
+
+    def buscar_por_nombre(self, nombre_usuario, limite=5):
+        _, filas, por_palabra = self._vigente()
+        query_words = set(limpiar_texto(nombre_usuario).split())
+
+        # Solo se puntúan las filas que comparten al menos una palabra con la consulta
+        candidatos = set()
+        for q_word in query_words:
+            candidatos.update(por_palabra.get(q_word, ()))
+
+        matches = []
+        for pos in sorted(candidatos):
+            id_base, nombre_base, nombre_base_words = filas[pos]
+            palabras_comunes = query_words.intersection(nombre_base_words)
+
+            score = 0
+            if query_words.issubset(nombre_base_words):
+                score += 100 * len(query_words)
             else:
-                break
-        
-        print(f"Enviando {len(final_phrases)} frases ({total_chars} caracteres) a la API de Speech.")
-        return final_phrases
+                score += 20 * len(palabras_comunes)
+
+            for q_word in query_words:
+                if len(q_word) > 2:
+                    for db_word in nombre_base_words:
+                        if q_word in db_word:
+                            score += 5
+                            if db_word.startswith(q_word):
+                                score += 10
+
+            if score > 10:
+                matches.append(((id_base, nombre_base), score))
+
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches[:limite]
+
+    def frases_speech(self):
+        datos = self._vigente()
+        calculadas_con, frases = self._frases
+        if calculadas_con is not datos:
+            frases = rankear_frases(datos[1])
+            self._frases = (datos, frases)
+            print(f"[clientes] Pistas de Speech: {len(frases)} frases ({sum(map(len, frases))} caracteres).")
+        return frases
+
+def rankear_frases(filas, max_frases=SPEECH_MAX_FRASES, max_caracteres=SPEECH_MAX_CARACTERES):
+    """
+    Frases para el SpeechContext: apellidos y nombres sueltos y nombres completos, de
+    la más frecuente a la menos frecuente (empates en orden alfabético), hasta llenar
+    los límites de Speech. Siempre devuelve lo mismo para la misma base.
+    """
+    conteo = Counter()
+    for _, nombre, _ in filas:
+        if len(nombre) <= 100:
+            conteo[nombre] += 1
+        partes = nombre.split()
+        if len(partes) > 1:
+            # Cada palabra cuenta una vez por cliente; se omiten "S.A.", "DE", "DEL", etc.
+            conteo.update(parte for parte in set(partes)
+                          if len(parte) > 2 and parte.isalpha() and parte.upper() not in _PARTICULAS)
 
+    frases = []
+    total_chars = 0
+    for frase, _ in sorted(conteo.items(), key=lambda item: (-item[1], item[0])):
+        if len(frases) >= max_frases:
+            break
+        if total_chars + len(frase) < max_caracteres:
+            frases.append(frase)
+            total_chars += len(frase)
+    return tuple(frases)
+
+_client_index = ClientIndex()
+
+def get_client_phrases():
+    """Pistas de frases para Speech (tupla, se reutiliza mientras la base no cambie)."""
+    try:
+        return _client_index.frases_speech()
     except FileNotFoundError:
         print("ADVERTENCIA: No se encontró 'base_clientes.txt' para las pistas de audio.")
-        return []
+        return ()
     except Exception as e:
         print(f"Error leyendo frases de clientes: {e}")
-        return []
+        return ()
 
 def buscar_nombre_por_id(identificacion):
     if not identificacion: return None
     try:
-        with open('base_clientes.txt', 'r', encoding='utf-8') as f:
-            for line in f:
-                id_base, nombre_base = parse_client_line(line)
-                if id_base and id_base == identificacion:
-                    return nombre_base
+        return _client_index.nombre_por_id(identificacion)
     except FileNotFoundError:
         print("ADVERTENCIA: No se encontró 'base_clientes.txt'.")
     except Exception as e:
@@ -74,53 +175,11 @@ def buscar_id_por_nombre(nombre_usuario):
     if not nombre_usuario or len(nombre_usuario.strip()) < 4:
         return []
 
-    def limpiar_texto(texto):
-        nfkd_form = unicodedata.normalize('NFKD', texto.lower())
-        texto_limpio = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
-        return re.sub(r'[^a-z0-9\s]', '', texto_limpio)
-
     try:
-        query = limpiar_texto(nombre_usuario)
-        query_words = set(query.split())
-
-        matches = []
-        with open('base_clientes.txt', 'r', encoding='utf-8') as f:
-            for line in f:
-                id_base, nombre_base = parse_client_line(line)
-                if not (id_base and nombre_base):
-                    continue
-                
-                nombre_limpio = limpiar_texto(nombre_base)
-                
-                score = 0
-                nombre_base_words = set(nombre_limpio.split())
-                palabras_comunes = query_words.intersection(nombre_base_words)
-                
-                if not palabras_comunes:
-                    continue
-
-                if query_words.issubset(nombre_base_words):
-                    score += 100 * len(query_words)
-                else:
-                    score += 20 * len(palabras_comunes)
-                
-                for q_word in query_words:
-                    if len(q_word) > 2:
-                        for db_word in nombre_base_words:
-                            if q_word in db_word:
-                                score += 5
-                                if db_word.startswith(q_word):
-                                    score += 10
-                
-                if score > 10:
-                    matches.append(((id_base, nombre_base), score))
-
-        matches.sort(key=lambda x: x[1], reverse=True)
-        return matches[:5]
-
+        return _client_index.buscar_por_nombre(nombre_usuario)
     except FileNotFoundError:
         print("ADVERTENCIA: No se encontró 'base_clientes.txt'.")
         return []
     except Exception as e:
         print(f"Error buscando por nombre: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,23 @@
+# bot/errors.py
+
+# --- MENSAJES DE ERROR PARA EL CLIENTE ---
+# Compartidos por app.py, tasks.py y services/meta_api.py.
+class BotError:
+    @staticmethod
+    def network_error(): return "🌐 **Error de conexión**\n\nHay problemas de conectividad. Por favor, intenta de nuevo en unos momentos."
+    @staticmethod
+    def ocr_error(): return "👁️ **Error de lectura**\n\nNo pude leer el texto de la imagen. Por favor:\n• Asegúrate de que la imagen esté clara\n• Verifica que tenga buena iluminación\n• Evita imágenes borrosas o muy pequeñas"
+    @staticmethod
+    def invalid_receipt(): return "📄 **Comprobante no válido**\n\nLa imagen no parece ser un comprobante de pago válido. Asegúrate de que contenga:\n• Información del banco o entidad\n• Monto de la transacción\n• Fecha del pago\n• Datos del destinatario"
+    @staticmethod
+    def wrong_recipient(): return "🎯 **Destinatario incorrecto**\n\nEl comprobante no parece ser para TRONCALNET o nuestras cuentas autorizadas. Verifica que el pago sea hacia:\n• Cuentas de TRONCALNET\n• Rodriguez Quinteros\n• Números de cuenta autorizados"
+    @staticmethod
+    def duplicate_receipt(): return "🔄 **Comprobante duplicado**\n\nEste comprobante ya fue registrado anteriormente. Cada comprobante solo puede ser usado una vez.\n\nSi crees que es un error, contacta soporte con `/soporte`."
+    @staticmethod
+    def client_not_found(name): return f"👤 **Cliente no encontrado**\n\nNo encontré a '{name}' en nuestra base de datos.\n\n**Sugerencias:**\n• Verifica que el nombre esté completo\n• Intenta con la cédula/RUC\n• Usa `/soporte` si necesitas ayuda"
+    @staticmethod
+    def system_error(): return "⚠️ **Error del sistema**\n\nOcurrió un error técnico. Por favor:\n• Intenta de nuevo en unos momentos\n• Si persiste, usa `/soporte`\n• Como alternativa, escribe `/reset` para empezar de nuevo"
+    @staticmethod
+    def rate_limit_exceeded(): return "⏳ **Muchos mensajes**\n\nHas enviado muchos mensajes muy rápido. Por favor, espera un momento antes de continuar.\n\n💡 Tip: Puedes usar `/ayuda` para ver todos los comandos disponibles."
+    @staticmethod
+    def storage_error(): return "💾 **Error de almacenamiento**\n\nHay un problema temporal con el almacenamiento de archivos. Por favor, intenta de nuevo en unos momentos."
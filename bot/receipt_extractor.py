@@ -0,0 +1,200 @@
+# bot/receipt_extractor.py
+import re
+from datetime import datetime
+from functools import lru_cache
+
+from bot.receipt_matcher import identificar_banco
+
+# --- EXTRACCIÓN DE CAMPOS DEL COMPROBANTE ---
+# El texto OCR se recorre una sola vez con una expresión compilada que lo parte en
+# tokens con tipo (fecha, monto, palabra, salto de línea, signo). Monto, fecha y número
+# de documento salen de ese mismo recorrido. Ningún patrón vuelve a mirar el resto del
+# texto, así que el costo crece en línea con el largo del OCR (PDF de varias páginas).
+
+MESES_ES = {'ene': '01', 'feb': '02', 'mar': '03', 'abr': '04', 'may': '05', 'jun': '06', 'jul': '07', 'ago': '08', 'sep': '09', 'oct': '10', 'nov': '11', 'dic': '12'}
+NOMBRES_BANCOS_DOC = {'pichincha', 'guayaquil', 'produbanco', 'jep', 'jardin azuayo', 'bolivariano', 'pacifico', 'internacional'}
+PALABRAS_NO_DOCUMENTO = {'numero', 'codigo', 'comprobante', 'referencia'}
+
+# Palabras que anteceden a un monto o a un número de documento. Como en los patrones
+# anteriores, también valen al final de otra palabra ("subtotal", "nref").
+ETIQUETAS_MONTO = ('monto', 'valor', 'total', 'pago')
+ETIQUETAS_DOCUMENTO = ('comprobante', 'ref', 'referencia', 'secuencial', 'documento')
+ETIQUETAS_TRANSACCION = ('transaccion', 'transacción')
+
+# Los cuatro formatos de fecha, en orden de prioridad (d-mes-a, a-mes-d, d/m/a, a/m/d).
+# El mes en letras tiene que ser uno de MESES_ES ("23 usd 45.00" no es una fecha).
+_MES = "(?:" + "|".join(MESES_ES) + ")"
+_PATRONES_FECHA = {
+    'fecha_dma_texto': rf'\d{{1,2}}[/\s-]{_MES}[/\s-]\d{{2,4}}',
+    'fecha_amd_texto': rf'\d{{4}}[/\s-]{_MES}[/\s-]\d{{1,2}}',
+    'fecha_dma': r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
+    'fecha_amd': r'\d{4}[/-]\d{1,2}[/-]\d{1,2}',
+}
+_PATRON_MONTO = r'[\d,]+\.\d{2}'
+_FECHA_O_MONTO = "|".join([*_PATRONES_FECHA.values(), _PATRON_MONTO])
+# Una palabra no se come las cifras donde empieza una fecha o un monto: en "usd12.50" o
+# "fecha12/01/2024" el monto y la fecha salen como tokens propios.
+_TOKEN_REGEX = re.compile(
+    "|".join(f"(?P<{nombre}>{patron})" for nombre, patron in _PATRONES_FECHA.items())
+    + rf"|(?P<monto>{_PATRON_MONTO})"
+    + rf"|(?P<palabra>(?:[^\W\d]++|(?!{_FECHA_O_MONTO})\d++)+)"
+    + r"|(?P<salto>\n)|(?P<signo>[^\w\s])"
+)
+_PARTES_FECHA = re.compile(r'[/\s-]')
+_DOCUMENTO_JM = re.compile(r'jm\d{4}[a-z]{3}\d+')
+
+# Prioridad de cada forma de encontrar el número de documento (menor gana)
+_DOC_NO_JM, _DOC_NO, _DOC_TRANSACCION, _DOC_MOVIMIENTO, _DOC_ETIQUETA, _DOC_CODIGO, _DOC_NUMERICO = range(7)
+
+class CamposComprobante:
+    """Monto, fecha, número de documento y banco leídos de un texto OCR."""
+    __slots__ = ('monto', 'fecha', 'documento', 'banco')
+
+    def __init__(self, monto, fecha, documento, banco):
+        self.monto = monto          # "123.45" o "0.00"
+        self.fecha = fecha          # "dd/mm/aaaa" o None si no hay fecha en el texto
+        self.documento = documento  # en mayúsculas o "No encontrado"
+        self.banco = banco
+
+def _formatear_fecha(formato, texto):
+    a, b, c = _PARTES_FECHA.split(texto)
+    if formato == 'fecha_dma_texto':
+        return f"{a.zfill(2)}/{MESES_ES[b]}/{'20' + c if len(c) == 2 else c}"
+    if formato == 'fecha_amd_texto':
+        return f"{c.zfill(2)}/{MESES_ES[b]}/{a}"
+    if formato == 'fecha_dma':
+        return f"{a.zfill(2)}/{b.zfill(2)}/{'20' + c if len(c) == 2 else c}"
+    return f"{c.zfill(2)}/{b.zfill(2)}/{a}"
+
+def _es_documento(palabra):
+    if palabra in NOMBRES_BANCOS_DOC or palabra in PALABRAS_NO_DOCUMENTO:
+        return False
+    return len(palabra) >= 6 and (len(palabra) > 8 or not palabra.isalpha())
+
+def _prioridad_tras_etiqueta(etiqueta, palabra, pegada):
+    # Qué tipo de candidato es la palabra que sigue a una etiqueta (None si no sirve)
+    if not (palabra.isascii() and palabra.isalnum()):
+        return None
+    # Otra etiqueta ("No. documento : Comprobante documento") no es el número: el patrón
+    # anterior se comía la etiqueta y seguía buscando
+    if palabra in ETIQUETAS_DOCUMENTO:
+        return None
+    if etiqueta == 'no.':
+        if pegada and _DOCUMENTO_JM.fullmatch(palabra):
+            return _DOC_NO_JM
+        return _DOC_NO if len(palabra) >= 10 else None
+    if len(palabra) < 6 or len(palabra) > 25:
+        return None
+    return {'transaccion': _DOC_TRANSACCION, 'movimiento': _DOC_MOVIMIENTO, 'documento': _DOC_ETIQUETA}.get(etiqueta)
+
+def _tokenizar(texto):
+    """Único recorrido del texto: devuelve montos (con o sin etiqueta), la primera fecha de cada formato y el mejor documento."""
+    montos_etiquetados, montos = [], []
+    fechas = {}
+    documentos = [None] * 7
+    pendientes = []      # códigos de la línea actual que esperan una cifra después
+    etiqueta_monto = None  # 'etiqueta' (admite un ':' después), 'etiqueta:' o 'moneda'
+    etiqueta_doc = None  # 'no', 'no.', 'cod', 'cod.', 'transaccion', 'movimiento', 'documento'
+    punto_permitido = False
+    fin_anterior = fin_etiqueta = -1
+
+    for match in _TOKEN_REGEX.finditer(texto):
+        tipo, valor, inicio = match.lastgroup, match.group(), match.start()
+        pegado = inicio == fin_anterior
+        fin_anterior = match.end()
+
+        if tipo == 'palabra':
+            # Como en el patrón anterior, la palabra que sigue a "comprobante/ref/..." se
+            # toma como candidata aunque se descarte, y entonces no abre otra etiqueta
+            consumida = etiqueta_doc == 'documento' and 6 <= len(valor) <= 25 and valor.isascii() and valor.isalnum()
+            if etiqueta_doc in ('no.', 'transaccion', 'movimiento', 'documento'):
+                prioridad = _prioridad_tras_etiqueta(etiqueta_doc, valor, inicio == fin_etiqueta)
+                if prioridad is not None and documentos[prioridad] is None and _es_documento(valor):
+                    documentos[prioridad] = valor
+            if not valor.isalpha() and any(ch.isdigit() for ch in valor):
+                if pendientes and documentos[_DOC_CODIGO] is None:
+                    documentos[_DOC_CODIGO] = pendientes[0]
+                pendientes.clear()
+            if 7 <= len(valor) <= 25 and valor.isascii() and valor.isalnum() and _es_documento(valor):
+                pendientes.append(valor)
+                if 9 <= len(valor) and valor.isdigit() and documentos[_DOC_NUMERICO] is None:
+                    documentos[_DOC_NUMERICO] = valor
+
+            if valor.endswith('usd'):
+                etiqueta_monto = 'moneda'
+            else:
+                etiqueta_monto = 'etiqueta' if valor.endswith(ETIQUETAS_MONTO) else None
+            punto_permitido = valor.endswith(ETIQUETAS_DOCUMENTO) and not consumida
+            if etiqueta_doc == 'cod.' and valor == 'movimiento':
+                etiqueta_doc = 'movimiento'
+            elif valor.endswith(ETIQUETAS_TRANSACCION):
+                etiqueta_doc = 'transaccion'
+            elif punto_permitido:
+                etiqueta_doc = 'documento'
+            elif valor == 'no':
+                etiqueta_doc = 'no'
+            elif valor.endswith('cod'):
+                etiqueta_doc = 'cod'
+            else:
+                etiqueta_doc = None
+            fin_etiqueta = fin_anterior
+        elif tipo == 'signo':
+            if valor == '.':
+                if etiqueta_doc in ('no', 'cod') and pegado:
+                    etiqueta_doc += '.'
+                    fin_etiqueta = fin_anterior
+                elif etiqueta_doc == 'documento' and punto_permitido and pegado:
+                    punto_permitido = False
+                else:
+                    etiqueta_doc = None
+            elif etiqueta_doc in ('no', 'cod'):
+                etiqueta_doc = None
+            punto_permitido = punto_permitido and valor == '.'
+            if valor == '$':
+                etiqueta_monto = 'moneda'
+            elif valor == ':' and etiqueta_monto == 'etiqueta':
+                etiqueta_monto = 'etiqueta:'
+            else:
+                etiqueta_monto = None
+        elif tipo == 'salto':
+            pendientes.clear()
+            punto_permitido = False
+            if etiqueta_doc in ('no', 'cod'):
+                etiqueta_doc = None
+        else:
+            if pendientes and documentos[_DOC_CODIGO] is None:
+                documentos[_DOC_CODIGO] = pendientes[0]
+            pendientes.clear()
+            etiqueta_doc = None
+            if tipo == 'monto':
+                (montos_etiquetados if etiqueta_monto else montos).append(float(valor.replace(',', '')))
+            elif tipo not in fechas:
+                fechas[tipo] = valor
+            etiqueta_monto = None
+
+    documento = next((doc for doc in documentos if doc is not None), None)
+    return montos_etiquetados, montos, fechas, documento
+
+@lru_cache(maxsize=64)
+def extraer_campos(texto):
+    """Todos los campos del comprobante en un solo recorrido. Se cachea igual que analizar_texto."""
+    montos_etiquetados, montos, fechas, documento = _tokenizar((texto or "").lower())
+    candidatos = montos_etiquetados or [m for m in montos if m > 0]
+    monto = f"{max(candidatos):.2f}" if candidatos else "0.00"
+    formato = next((f for f in _PATRONES_FECHA if f in fechas), None)
+    fecha = _formatear_fecha(formato, fechas[formato]) if formato else None
+    return CamposComprobante(monto, fecha, documento.upper() if documento else "No encontrado", identificar_banco(texto))
+
+# --- FUNCIONES DE EXTRACCIÓN (misma interfaz que antes) ---
+def buscar_monto(texto_completo):
+    if not texto_completo: return "0.00"
+    return extraer_campos(texto_completo).monto
+
+def buscar_fecha(texto_completo):
+    # La fecha de hoy no se guarda en la caché: se calcula en cada llamada
+    fecha = extraer_campos(texto_completo).fecha if texto_completo else None
+    return fecha or datetime.now().strftime("%d/%m/%Y")
+
+def buscar_numero_documento(texto_completo):
+    if not texto_completo: return "No encontrado"
+    return extraer_campos(texto_completo).documento
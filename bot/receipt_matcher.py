@@ -0,0 +1,210 @@
+# bot/receipt_matcher.py
+import re
+import unicodedata
+from functools import lru_cache
+
+# --- CLASIFICADOR DE TEXTO DE COMPROBANTES E INTENCIONES ---
+# Todas las palabras clave se compilan una sola vez en una expresión regular combinada
+# (un árbol de prefijos).
+# El texto se normaliza una vez (minúsculas, sin tildes) y se recorre una vez; el
+# resultado (SenalesTexto) trae todas las señales que usan las validaciones.
+
+PALABRAS_TRANSACCION = ['transferencia', 'pago exitoso', 'comprobante', 'transaccion', 'deposito', 'transferido']
+BANCOS_COMPROBANTE = ['pichincha', 'guayaquil', 'produbanco', 'jep', 'jardin azuayo', 'bolivariano', 'pacifico', 'internacional', 'cb']
+# Estas se buscan como palabras completas
+PALABRAS_FINANCIERAS = ['cuenta', 'monto', 'valor', 'fecha', 'total', 'efectivo', 'documento', 'nombre', 'destino']
+NOMBRE_EMPRESA = 'troncalnet'
+NOMBRES_DESTINO = ['rodriguez', 'quinteros', 'ismael']
+FRASES_RECAUDACION = ["de recaudacion", "recaudaciones", "pago en efectivo", "empresa o servicio", "pago de servicio", "pago de servicios", "cuenta o contrato"]
+
+# El orden define la prioridad cuando el texto menciona varios bancos
+BANCOS_ECUADOR = {
+    "Banco del Pacífico": ["pacifico", "bancodelpacifico", "banco del pacifico", "bdp"],
+    "Banco Pichincha": ["pichincha", "banco pichincha"],
+    "Banco Guayaquil": ["guayaquil", "bancoguayaquil", "banco guayaquil"],
+    "Produbanco": ["produbanco", "prodomatico"],
+    "Banco Bolivariano": ["bolivariano"], "Banco Internacional": ["internacional"], "Banco Austro": ["austro"],
+    "Cooperativa JEP": ["jep"], "Cooperativa Jardín Azuayo": ["jardin azuayo"],
+    "Cooperativa CB": ["cooperativa cb", "cb en linea", "cb movil", "biblian"]
+}
+
+# El orden define el desempate entre intenciones con el mismo puntaje
+INTENCIONES = {
+    "SIN_INTERNET": ["sin internet", "no tengo internet", "internet lento", "falla el internet", "inestable", "no puedo navegar", "se me va el internet", "no hay servicio"],
+    "SIN_TV": ["sin señal", "no tengo canales", "falla la tele", "problema con el tvcable", "canales no se ven", "falla el cable"],
+    "PROBLEMA_PAGO": ["problema con mi pago", "no se registra mi pago", "pago no aplicado", "error en la factura", "cobro indebido", "inconveniente con el pago", "pague y no se refleja", "mi pago no aparece", "duda sobre mi pago", "error en el pago", "ya pague", "ya pagué", "tengo un problema con un pago"],
+    "INFO_PLANES": ["informacion de planes", "quiero un plan", "que planes tienen", "aumentar megas", "cambiar de plan"]
+}
+
+# Traducción directa de las letras con tilde más comunes; lo demás pasa por NFKD
+_SIN_TILDES = str.maketrans("áéíóúàèìòùäëïöüâêîôûñç", "aeiouaeiouaeiouaeiounc")
+
+def normalizar_texto(texto):
+    """Minúsculas y sin tildes ni diéresis (la ñ queda como n)."""
+    texto = texto.lower().translate(_SIN_TILDES)
+    if texto.isascii():
+        return texto
+    nfkd = unicodedata.normalize('NFKD', texto)
+    return "".join(c for c in nfkd if not unicodedata.combining(c))
+
+def _regex_trie(palabras):
+    # Una alternativa por letra en lugar de una por palabra: el motor de re avanza por
+    # el árbol de prefijos y en cada posición se queda con la palabra más larga.
+    trie = {}
+    for palabra in palabras:
+        nodo = trie
+        for ch in palabra:
+            nodo = nodo.setdefault(ch, {})
+        nodo[""] = True
+
+    def construir(nodo):
+        ramas = [re.escape(ch) + construir(hijo) for ch, hijo in sorted(nodo.items()) if ch]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        return "(?:" + cuerpo + ")?" if "" in nodo else cuerpo
+
+    return re.compile(construir(trie))
+
+def _construir_matcher():
+    palabras = {}  # palabra clave normalizada -> {(categoria, etiqueta)}
+    def agregar(keywords, categoria, etiqueta=None):
+        for kw in keywords:
+            palabras.setdefault(normalizar_texto(kw), set()).add((categoria, etiqueta or kw))
+
+    agregar(PALABRAS_TRANSACCION, "transaccion")
+    agregar(BANCOS_COMPROBANTE, "banco_comprobante")
+    agregar(PALABRAS_FINANCIERAS, "financiera")
+    agregar([NOMBRE_EMPRESA], "empresa")
+    agregar(NOMBRES_DESTINO, "destino")
+    agregar(FRASES_RECAUDACION, "recaudacion")
+    for banco, keywords in BANCOS_ECUADOR.items():
+        agregar(keywords, "banco", banco)
+    for intencion, keywords in INTENCIONES.items():
+        agregar(keywords, "intencion", intencion)
+
+    # El recorrido no se solapa, así que para cada palabra se precalcula:
+    # - contenidas: palabras clave que aparecen dentro de ella (incluida ella misma);
+    #   las que deben ser palabra completa se guardan con su posición para comprobarlas;
+    # - solapes: posiciones dentro de ella donde otra palabra podría empezar y terminar
+    #   después (p. ej. "ya pague" / "pague y no se refleja").
+    completas = {normalizar_texto(p) for p in PALABRAS_FINANCIERAS}
+    contenidas = {}
+    solapes = {}
+    for kw in palabras:
+        dentro = [(otra, i) for otra in palabras for i in range(len(kw)) if kw.startswith(otra, i)]
+        contenidas[kw] = (
+            frozenset(otra for otra, _ in dentro if otra not in completas),
+            [(otra, i) for otra, i in dentro if otra in completas],
+        )
+        solapes[kw] = [i for i in range(1, len(kw))
+                       if any(otra.startswith(kw[i:]) and len(otra) > len(kw) - i for otra in palabras)]
+    return _regex_trie(palabras), palabras, contenidas, solapes
+
+_TRIE, _PALABRAS, _CONTENIDAS, _SOLAPES = _construir_matcher()
+_MONTO_REGEX = re.compile(r'[\d,]+\.\d{2}')
+# "ya pague" y "ya pagué" son la misma palabra clave una vez normalizadas
+_INTENCIONES_NORMALIZADAS = {intent: {normalizar_texto(kw) for kw in keywords} for intent, keywords in INTENCIONES.items()}
+
+def _es_palabra_completa(texto, inicio, fin):
+    return (inicio == 0 or not texto[inicio - 1].isalnum()) and (fin == len(texto) or not texto[fin].isalnum())
+
+class SenalesTexto:
+    """Señales encontradas en un texto: palabras clave por categoría y si hay un monto."""
+
+    def __init__(self, encontradas, tiene_monto):
+        self.encontradas = encontradas  # categoria -> set de etiquetas
+        self.tiene_monto = tiene_monto
+
+    def categoria(self, nombre):
+        return self.encontradas.get(nombre, set())
+
+    @property
+    def menciona_empresa(self):
+        return bool(self.categoria("empresa"))
+
+    @property
+    def destino_valido(self):
+        return bool(self.categoria("destino"))
+
+    @property
+    def es_recaudacion(self):
+        return self.menciona_empresa and bool(self.categoria("recaudacion"))
+
+    @property
+    def condiciones_comprobante(self):
+        return sum([
+            bool(self.categoria("transaccion")),
+            self.tiene_monto,
+            bool(self.categoria("banco_comprobante")),
+            bool(self.categoria("financiera")),
+        ])
+
+    @property
+    def banco(self):
+        bancos = self.categoria("banco")
+        for banco in BANCOS_ECUADOR:
+            if banco in bancos:
+                return banco
+        return None
+
+    @property
+    def intencion(self):
+        encontradas = self.categoria("intencion")
+        scores = {intent: len(keywords & encontradas) for intent, keywords in _INTENCIONES_NORMALIZADAS.items()}
+        max_score = max(scores.values())
+        return max(scores, key=scores.get) if max_score > 0 else None
+
+def _registrar(texto, kw, inicio, vistas):
+    libres, completas = _CONTENIDAS[kw]
+    vistas |= libres
+    for otra, desplazamiento in completas:
+        pos = inicio + desplazamiento
+        if otra not in vistas and _es_palabra_completa(texto, pos, pos + len(otra)):
+            vistas.add(otra)
+
+@lru_cache(maxsize=64)
+def analizar_texto(texto):
+    """Normaliza y recorre el texto una sola vez. Se cachea porque las validaciones de un mismo comprobante se llaman seguidas."""
+    texto_normalizado = normalizar_texto(texto or "")
+    vistas = set()
+    for match in _TRIE.finditer(texto_normalizado):
+        kw, inicio, fin = match.group(), match.start(), match.end()
+        _registrar(texto_normalizado, kw, inicio, vistas)
+        for desplazamiento in _SOLAPES[kw]:
+            solapada = _TRIE.match(texto_normalizado, inicio + desplazamiento)
+            if solapada and solapada.end() > fin:
+                _registrar(texto_normalizado, solapada.group(), solapada.start(), vistas)
+
+    encontradas = {}
+    for kw in vistas:
+        for categoria, etiqueta in _PALABRAS[kw]:
+            # Las intenciones se cuentan por palabra clave; el resto por etiqueta
+            encontradas.setdefault(categoria, set()).add(kw if categoria == "intencion" else etiqueta)
+    return SenalesTexto(encontradas, bool(_MONTO_REGEX.search(texto_normalizado)))
+
+# --- FUNCIONES DE VALIDACIÓN (misma interfaz que antes) ---
+def contiene_nombre_empresa(texto_completo):
+    if not texto_completo: return False
+    return analizar_texto(texto_completo).menciona_empresa
+
+def validar_destino_pago(texto_completo):
+    if not texto_completo:
+        return False
+    return analizar_texto(texto_completo).destino_valido
+
+def es_comprobante_valido(texto_completo):
+    if not texto_completo: return False
+    return analizar_texto(texto_completo).condiciones_comprobante >= 3
+
+def es_recaudacion_directa(texto_completo):
+    if not texto_completo: return False
+    return analizar_texto(texto_completo).es_recaudacion
+
+def analizar_intencion(texto):
+    if not texto: return None
+    return analizar_texto(texto).intencion
+
+def identificar_banco(texto_completo):
+    if not texto_completo: return "Entidad no identificada"
+    return analizar_texto(texto_completo).banco or "Entidad no identificada"
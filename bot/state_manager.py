@@ -1,53 +1,182 @@
+# Al inicio de bot/state_manager.py
+import json
+import os
+import re
+import time
+import tempfile
+import threading
+
+from services.utils import BOT_CONFIG
+
 # --- SISTEMA DE MEMORIA PERSISTENTE ---
-SESSION_FILE = "session_data.json"
+# El backend se elige con SESSION_BACKEND ("memory", "file" o "redis").
+# Si no se indica, se usa Redis cuando existe REDIS_URL (el mismo de Celery) y si no, archivos.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "").strip().lower()
+SESSION_DIR = os.getenv("SESSION_DIR", "sessions")
+SESSION_TTL_SECONDS = BOT_CONFIG['session_timeout_minutes'] * 60
 
-def guardar_estado(user_id, state_data):
-    try:
+class SessionStore:
+    """Interfaz común: get devuelve {} si no hay sesión, delete devuelve la sesión borrada."""
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def set(self, user_id, state_data, ttl=SESSION_TTL_SECONDS):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+class MemorySessionStore(SessionStore):
+    """Sesiones en un dict del proceso, con expiración por clave."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._sessions.get(user_id)
+            if not item:
+                return {}
+            expira, state_data = item
+            if expira is not None and expira <= time.time():
+                del self._sessions[user_id]
+                return {}
+            return dict(state_data)
+
+    def set(self, user_id, state_data, ttl=SESSION_TTL_SECONDS):
+        expira = time.time() + ttl if ttl else None
+        with self._lock:
+            self._sessions[user_id] = (expira, dict(state_data))
+
+    def delete(self, user_id):
+        with self._lock:
+            item = self._sessions.pop(user_id, None)
+        return dict(item[1]) if item else {}
+
+class FileSessionStore(SessionStore):
+    """Un archivo JSON por usuario, escrito de forma atómica (archivo temporal + os.replace)."""
+
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, user_id):
+        nombre = re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))
+        return os.path.join(self.directory, f"{nombre}.json")
+
+    def _leer(self, path):
         try:
-            with open(SESSION_FILE, 'r', encoding='utf-8') as f:
-                sessions = json.load(f)
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            sessions = {}
-        sessions[user_id] = state_data
-        with open(SESSION_FILE, 'w', encoding='utf-8') as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=4)
+            return None
+
+    def get(self, user_id):
+        path = self._path(user_id)
+        item = self._leer(path)
+        if not item:
+            return {}
+        expira = item.get("expira")
+        if expira is not None and expira <= time.time():
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            return {}
+        return item.get("estado", {})
+
+    def set(self, user_id, state_data, ttl=SESSION_TTL_SECONDS):
+        item = {"expira": time.time() + ttl if ttl else None, "estado": state_data}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(item, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(user_id))
+        except Exception:
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+            raise
+
+    def delete(self, user_id):
+        path = self._path(user_id)
+        item = self._leer(path)
+        try: os.remove(path)
+        except FileNotFoundError: pass
+        return (item or {}).get("estado", {})
+
+class RedisSessionStore(SessionStore):
+    """Sesiones en Redis con SET ... EX, compartidas entre instancias web y workers."""
+
+    def __init__(self, url, prefix="sesion:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, user_id):
+        raw = self._redis.get(self._prefix + str(user_id))
+        return json.loads(raw) if raw else {}
+
+    def set(self, user_id, state_data, ttl=SESSION_TTL_SECONDS):
+        raw = json.dumps(state_data, ensure_ascii=False)
+        self._redis.set(self._prefix + str(user_id), raw, ex=ttl or None)
+
+    def delete(self, user_id):
+        key = self._prefix + str(user_id)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.get(key)
+        pipe.delete(key)
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw else {}
+
+def crear_session_store(backend=SESSION_BACKEND):
+    redis_url = os.getenv("REDIS_URL")
+    if not backend:
+        backend = "redis" if redis_url else "file"
+    if backend == "redis":
+        try:
+            store = RedisSessionStore(redis_url or "redis://localhost:6379/0")
+            store._redis.ping()
+            print("[sesiones] Usando Redis para las sesiones.")
+            return store
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo usar Redis para sesiones ({e}). Se usarán archivos.")
+            backend = "file"
+    if backend == "memory":
+        return MemorySessionStore()
+    return FileSessionStore()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = crear_session_store()
+    return _store
+
+def guardar_estado(user_id, state_data):
+    try:
+        get_session_store().set(user_id, state_data)
     except Exception as e:
         print(f"Error guardando estado: {e}")
-# Al inicio de bot/state_manager.py
-import json
-import os
-
-# Define la constante del archivo de sesión aquí
-SESSION_FILE = "session_data.json"
 
 def cargar_estado(user_id):
     try:
-        with open(SESSION_FILE, 'r', encoding='utf-8') as f:
-            sessions = json.load(f)
-        return sessions.get(user_id, {})
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+        return get_session_store().get(user_id)
     except Exception as e:
         print(f"Error cargando estado: {e}")
         return {}
 
 def borrar_estado(user_id):
     try:
-        try:
-            with open(SESSION_FILE, 'r', encoding='utf-8') as f:
-                sessions = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return
-        if user_id in sessions:
-            state = sessions[user_id]
-            if 'temp_filepath' in state and state['temp_filepath'] and os.path.exists(state['temp_filepath']):
-                try:
-                    os.remove(state['temp_filepath'])
-                    print(f"Archivo temporal eliminado: {state['temp_filepath']}")
-                except Exception as e:
-                    print(f"Error eliminando archivo temporal: {e}")
-            del sessions[user_id]
-        with open(SESSION_FILE, 'w', encoding='utf-8') as f:
-            json.dump(sessions, f, ensure_ascii=False, indent=4)
+        state = get_session_store().delete(user_id)
+        if 'temp_filepath' in state and state['temp_filepath'] and os.path.exists(state['temp_filepath']):
+            try:
+                os.remove(state['temp_filepath'])
+                print(f"Archivo temporal eliminado: {state['temp_filepath']}")
+            except Exception as e:
+                print(f"Error eliminando archivo temporal: {e}")
     except Exception as e:
         print(f"Error borrando estado: {e}")
@@ -0,0 +1,8 @@
+# gunicorn.conf.py
+# gunicorn lo lee solo al arrancar desde la raíz del proyecto (startCommand "gunicorn app:app").
+
+def post_worker_init(worker):
+    # Cada worker arranca su propio pool de CPU con la app ya cargada, y no al importar
+    # app (eso también lo hacen tasks.py y el worker de Celery).
+    from services.cpu_pool import cpu_pool
+    cpu_pool.calentar()
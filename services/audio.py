@@ -0,0 +1,198 @@
+# services/audio.py
+import os
+import struct
+import threading
+from io import BytesIO
+
+from .concurrencia import HilosPorProceso
+
+# --- PREPARACIÓN DE AUDIO PARA SPEECH ---
+# Las notas de voz de WhatsApp llegan como OGG/Opus, que Speech acepta tal cual
+# (encoding OGG_OPUS). Solo los formatos que Speech no lee directamente y los audios
+# largos se decodifican con pydub (necesita ffmpeg) y se envían como FLAC 16 kHz mono.
+
+# Tasas de muestreo que Speech acepta para OGG_OPUS; Opus siempre puede decodificar a 48 kHz
+TASAS_OPUS = (8000, 12000, 16000, 24000, 48000)
+# recognize síncrono rechaza audios de más de ~60 s: los largos se cortan en silencios en
+# tramos de a lo sumo AUDIO_TRAMO_MAX_SEGUNDOS que se transcriben en paralelo.
+SPEECH_MAX_SEGUNDOS = 55
+AUDIO_TRAMO_MAX_SEGUNDOS = int(os.getenv("AUDIO_TRAMO_MAX_SEGUNDOS", "45"))
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", "4"))
+
+class AudioPreparado:
+    """Bytes listos para RecognitionAudio y los datos que van en RecognitionConfig."""
+    __slots__ = ('contenido', 'encoding', 'sample_rate', 'canales', 'transcodificado')
+
+    def __init__(self, contenido, encoding, sample_rate=None, canales=1, transcodificado=False):
+        self.contenido = contenido
+        self.encoding = encoding        # nombre de RecognitionConfig.AudioEncoding
+        self.sample_rate = sample_rate  # None: Speech lo lee del encabezado (FLAC/WAV)
+        self.canales = canales
+        self.transcodificado = transcodificado
+
+def _formato_ogg(contenido):
+    # Primera página OGG: 27 bytes de encabezado + tabla de segmentos; el primer paquete
+    # de un stream Opus es "OpusHead" (versión, canales, pre-skip, tasa de entrada)
+    if len(contenido) < 28:
+        return None
+    inicio = 27 + contenido[26]
+    cabecera = contenido[inicio:inicio + 19]
+    if len(cabecera) < 19 or cabecera[:8] != b"OpusHead":
+        return None
+    canales = cabecera[9]
+    tasa = struct.unpack_from("<I", cabecera, 12)[0]
+    return AudioPreparado(contenido, "OGG_OPUS", tasa if tasa in TASAS_OPUS else 48000, max(canales, 1))
+
+def _formato_wav(contenido):
+    # Solo PCM de 16 bits (LINEAR16) con el bloque fmt al inicio, que es lo habitual
+    if len(contenido) < 36 or contenido[8:16] != b"WAVEfmt ":
+        return None
+    formato, canales = struct.unpack_from("<HH", contenido, 20)
+    bits = struct.unpack_from("<H", contenido, 34)[0]
+    if formato != 1 or bits != 16:
+        return None
+    return AudioPreparado(contenido, "LINEAR16", None, canales)
+
+def detectar_formato(contenido):
+    """AudioPreparado si Speech puede leer los bytes sin convertirlos; None si no."""
+    if not contenido:
+        return None
+    if contenido[:4] == b"OggS":
+        return _formato_ogg(contenido)
+    if contenido[:9] == b"#!AMR-WB\n":
+        return AudioPreparado(contenido, "AMR_WB", 16000)
+    if contenido[:6] == b"#!AMR\n":
+        return AudioPreparado(contenido, "AMR", 8000)
+    if contenido[:4] == b"fLaC":
+        return AudioPreparado(contenido, "FLAC")
+    if contenido[:4] == b"RIFF":
+        return _formato_wav(contenido)
+    return None
+
+# --- DURACIÓN SIN DECODIFICAR ---
+def _duracion_ogg(contenido):
+    # granule position de la última página = muestras a 48 kHz, menos el pre-skip de OpusHead
+    inicio = 27 + contenido[26]
+    pre_skip = struct.unpack_from("<H", contenido, inicio + 10)[0]
+    ultima = contenido.rfind(b"OggS")
+    if ultima < 0 or len(contenido) < ultima + 14:
+        return None
+    granule = struct.unpack_from("<q", contenido, ultima + 6)[0]
+    return max(granule - pre_skip, 0) / 48000 if granule >= 0 else None
+
+def _duracion_wav(contenido):
+    byte_rate = struct.unpack_from("<I", contenido, 28)[0]
+    pos = 12
+    while pos + 8 <= len(contenido):
+        bloque, tamano = contenido[pos:pos + 4], struct.unpack_from("<I", contenido, pos + 4)[0]
+        if bloque == b"data":
+            return min(tamano, len(contenido) - pos - 8) / byte_rate if byte_rate else None
+        pos += 8 + tamano + (tamano & 1)
+    return None
+
+def _duracion_flac(contenido):
+    # STREAMINFO: tasa (20 bits), canales (3), bits (5) y total de muestras (36)
+    if len(contenido) < 26:
+        return None
+    valor = int.from_bytes(contenido[18:26], "big")
+    tasa, muestras = valor >> 44, valor & ((1 << 36) - 1)
+    return muestras / tasa if tasa and muestras else None
+
+def duracion_segundos(preparado):
+    """Duración leída de los encabezados; None si el formato no la trae (AMR) o no se pudo leer."""
+    lector = {"OGG_OPUS": _duracion_ogg, "LINEAR16": _duracion_wav, "FLAC": _duracion_flac}.get(preparado.encoding)
+    try:
+        return lector(preparado.contenido) if lector else None
+    except (struct.error, IndexError):
+        return None
+
+# --- TRANSCODIFICACIÓN Y CORTE EN SILENCIOS (pydub + ffmpeg) ---
+def _decodificar(contenido):
+    from pydub import AudioSegment  # solo hace falta para formatos no soportados o audios largos
+    return AudioSegment.from_file(BytesIO(contenido)).set_channels(1).set_frame_rate(16000)
+
+def _exportar_flac(audio):
+    buffer = BytesIO()
+    audio.export(buffer, format="flac")
+    return AudioPreparado(buffer.getvalue(), "FLAC", 16000, 1, transcodificado=True)
+
+def puntos_de_corte(niveles, ventana_ms, max_ms, umbral, silencio_min_ms=300):
+    """
+    Posiciones (ms) donde cortar, incluidas 0 y el final. niveles es el RMS de cada
+    ventana. Cada tramo mide a lo sumo max_ms y se corta en el centro del último
+    silencio de su segunda mitad; si no hay silencio, se corta en max_ms.
+    """
+    total_ms = len(niveles) * ventana_ms
+    silencios = []
+    inicio_silencio = None
+    for i, nivel in enumerate(niveles + [umbral + 1]):
+        if nivel < umbral:
+            if inicio_silencio is None:
+                inicio_silencio = i
+        elif inicio_silencio is not None:
+            if (i - inicio_silencio) * ventana_ms >= silencio_min_ms:
+                silencios.append((inicio_silencio + i) * ventana_ms // 2)
+            inicio_silencio = None
+
+    cortes = [0]
+    while total_ms - cortes[-1] > max_ms:
+        limite = cortes[-1] + max_ms
+        candidatos = [c for c in silencios if cortes[-1] + max_ms // 2 < c <= limite]
+        cortes.append(candidatos[-1] if candidatos else limite)
+    cortes.append(total_ms)
+    return cortes
+
+def dividir_por_silencios(audio, max_segundos=AUDIO_TRAMO_MAX_SEGUNDOS, ventana_ms=50):
+    niveles = [audio[i:i + ventana_ms].rms for i in range(0, len(audio), ventana_ms)]
+    # Mismo criterio que pydub: silencio = 16 dB por debajo del nivel medio
+    umbral = audio.rms * 10 ** (-16 / 20)
+    cortes = puntos_de_corte(niveles, ventana_ms, max_segundos * 1000, umbral)
+    return [audio[inicio:fin] for inicio, fin in zip(cortes, cortes[1:]) if fin > inicio]
+
+def preparar_tramos(contenido, max_segundos=SPEECH_MAX_SEGUNDOS):
+    """
+    Lista de AudioPreparado para transcribir, en orden. Un audio corto que Speech lee
+    tal cual se devuelve sin tocar; el resto se decodifica una vez y, si es largo, se
+    corta en silencios en tramos FLAC.
+    """
+    preparado = detectar_formato(contenido)
+    if preparado is not None:
+        duracion = duracion_segundos(preparado)
+        if duracion is None or duracion <= max_segundos:
+            return [preparado]
+    audio = _decodificar(contenido)
+    if len(audio) <= max_segundos * 1000:
+        return [_exportar_flac(audio)]
+    return [_exportar_flac(tramo) for tramo in dividir_por_silencios(audio)]
+
+_hilos = HilosPorProceso(AUDIO_WORKERS, "audio")
+
+def get_audio_executor():
+    """Pool de hilos para transcribir tramos en paralelo; se crea de nuevo tras un fork."""
+    return _hilos.get()
+
+# --- TIEMPOS POR ETAPA ---
+class AudioStats:
+    """Acumula el tiempo de cada etapa (descarga, preparación, speech) por formato de entrada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_formato = {}  # formato -> {"mensajes": n, "ms": {etapa: total}}
+
+    def registrar(self, formato, tiempos_ms):
+        with self._lock:
+            datos = self._por_formato.setdefault(formato, {"mensajes": 0, "ms": {}})
+            datos["mensajes"] += 1
+            for etapa, ms in tiempos_ms.items():
+                datos["ms"][etapa] = datos["ms"].get(etapa, 0.0) + ms
+
+    def resumen(self):
+        """Promedio en ms de cada etapa, por formato."""
+        with self._lock:
+            return {
+                formato: {"mensajes": datos["mensajes"],
+                          **{f"{etapa}_ms": round(total / datos["mensajes"], 1) for etapa, total in datos["ms"].items()}}
+                for formato, datos in self._por_formato.items()
+            }
+
+audio_stats = AudioStats()
@@ -0,0 +1,32 @@
+# services/concurrencia.py
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- AYUDAS DE CONCURRENCIA COMPARTIDAS ---
+
+def cronometrar(funcion, args):
+    """(funcion(*args), ms que tardó). Es de módulo para que el pool de procesos pueda enviarla."""
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+class HilosPorProceso:
+    """ThreadPoolExecutor que se crea al primer uso y de nuevo tras un fork (gunicorn, Celery)."""
+
+    def __init__(self, max_workers, nombre):
+        self.max_workers = max_workers
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.nombre)
+                    self._pid = pid
+        return self._executor
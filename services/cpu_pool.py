@@ -0,0 +1,128 @@
+# services/cpu_pool.py
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .concurrencia import cronometrar
+
+# --- POOL DE PROCESOS PARA TRABAJO DE CPU ---
+# phash, miniaturas, recompresión, render de PDF y la carga de la tabla de deudas
+# retienen el GIL: corriendo en los hilos de waitress frenan las respuestas de texto de
+# todos los demás usuarios. Esas etapas se envían a un pool de procesos acotado. Como
+# mucho hay CPU_MAX_PENDIENTES tareas en vuelo; quien envía la siguiente espera su turno
+# en vez de encolar sin límite. Los procesos arrancan con PIL, imagehash, fitz y numpy ya
+# importados. CPU_POOL=0 ejecuta todo en línea (desarrollo; render.yaml lo fija en el
+# worker de Celery). El pool se calienta al arrancar el servidor web, no al importar app.
+CPU_POOL_ACTIVO = os.getenv("CPU_POOL", "1") != "0"
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+CPU_MAX_PENDIENTES = int(os.getenv("CPU_MAX_PENDIENTES", str(CPU_WORKERS * 4)))
+MODULOS_PRECARGA = ("PIL.Image", "imagehash", "fitz", "numpy")
+
+def _precargar():
+    import importlib
+    for nombre in MODULOS_PRECARGA:
+        try:
+            importlib.import_module(nombre)
+        except ImportError:
+            pass
+
+def _nada():
+    return os.getpid()
+
+class CpuPool:
+
+    def __init__(self, max_workers=CPU_WORKERS, max_pendientes=CPU_MAX_PENDIENTES):
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._cupos = None
+        self._pendientes = 0
+        self.stats = {"enviadas": 0, "completadas": 0, "fallidas": 0, "en_linea": 0,
+                      "pendientes_max": 0, "espera_ms": 0.0, "ejecucion_ms": 0.0, "total_ms_max": 0.0}
+
+    def _preparar(self):
+        # Tras un fork (gunicorn, Celery) el pool y el semáforo del padre no sirven
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_precargar)
+                    self._cupos = threading.BoundedSemaphore(self.max_pendientes)
+                    self._pendientes = 0
+                    self._pid = pid
+        return self._executor, self._cupos
+
+    def calentar(self):
+        """Arranca todos los procesos del pool para que la primera imagen no pague el arranque."""
+        if not CPU_POOL_ACTIVO:
+            return
+        executor, _ = self._preparar()
+        futuros = [executor.submit(_nada) for _ in range(self.max_workers)]
+        print(f"[cpu_pool] {len({f.result() for f in futuros})} proceso(s) listos.")
+
+    def ejecutar(self, funcion, *args):
+        """
+        funcion(*args) en un proceso del pool; bloquea el hilo que llama (sin retener el
+        GIL) hasta el resultado. funcion y args deben poder serializarse con pickle.
+        """
+        if not CPU_POOL_ACTIVO:
+            return funcion(*args)
+        executor, cupos = self._preparar()
+        inicio = time.perf_counter()
+        cupos.acquire()
+        with self._lock:
+            self._pendientes += 1
+            self.stats["enviadas"] += 1
+            self.stats["pendientes_max"] = max(self.stats["pendientes_max"], self._pendientes)
+        ejecucion_ms = None
+        try:
+            resultado, ejecucion_ms = executor.submit(cronometrar, funcion, args).result()
+            return resultado
+        except BrokenProcessPool:
+            # Un proceso murió (p. ej. sin memoria): se recrea el pool y esta tarea corre en línea
+            print(f"[cpu_pool] Pool roto ejecutando {getattr(funcion, '__name__', funcion)}; se recrea.")
+            with self._lock:
+                if self._executor is executor:
+                    self._pid = None
+                self.stats["en_linea"] += 1
+            executor.shutdown(wait=False)
+            return funcion(*args)
+        finally:
+            total_ms = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                self._pendientes -= 1
+                if ejecucion_ms is None:
+                    self.stats["fallidas"] += 1
+                else:
+                    self.stats["completadas"] += 1
+                    self.stats["ejecucion_ms"] += ejecucion_ms
+                    self.stats["espera_ms"] += total_ms - ejecucion_ms
+                self.stats["total_ms_max"] = max(self.stats["total_ms_max"], total_ms)
+            cupos.release()
+
+    def resumen(self):
+        """Profundidad de la cola y latencia promedio: espera (cola + envío entre procesos) y ejecución."""
+        with self._lock:
+            stats = dict(self.stats)
+            pendientes = self._pendientes
+        completadas = stats["completadas"] or 1
+        return {
+            "pendientes": pendientes,
+            "pendientes_max": stats["pendientes_max"],
+            "enviadas": stats["enviadas"],
+            "completadas": stats["completadas"],
+            "fallidas": stats["fallidas"],
+            "en_linea": stats["en_linea"],
+            "espera_ms_prom": round(stats["espera_ms"] / completadas, 1),
+            "ejecucion_ms_prom": round(stats["ejecucion_ms"] / completadas, 1),
+            "total_ms_max": round(stats["total_ms_max"], 1),
+        }
+
+cpu_pool = CpuPool()
+
+def ejecutar_cpu(funcion, *args):
+    return cpu_pool.ejecutar(funcion, *args)
@@ -0,0 +1,69 @@
+# services/dispatcher.py
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .meta_api import enviar_mensaje_whatsapp, enviar_accion_escritura
+
+# --- COLA DE MENSAJES SALIENTES ---
+# El webhook solo encola; un pool de hilos entrega a Meta. Cada destinatario tiene su
+# propia cola FIFO y como máximo un hilo vaciándola, así los mensajes de un mismo
+# usuario llegan en orden y los de usuarios distintos se envían en paralelo.
+DISPATCHER_WORKERS = int(os.getenv("DISPATCHER_WORKERS", "8"))
+
+class OutboundDispatcher:
+
+    def __init__(self, max_workers=DISPATCHER_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatcher")
+        self._lock = threading.Lock()
+        self._colas = {}  # recipient_id -> deque de (funcion, args); existe mientras alguien la vacía
+        self.stats = {"encolados": 0, "enviados": 0, "fallidos": 0}
+
+    def encolar(self, recipient_id, funcion, *args):
+        with self._lock:
+            self.stats["encolados"] += 1
+            cola = self._colas.get(recipient_id)
+            if cola is not None:
+                cola.append((funcion, args))
+                return
+            self._colas[recipient_id] = deque([(funcion, args)])
+        self._executor.submit(self._vaciar, recipient_id)
+
+    def _vaciar(self, recipient_id):
+        while True:
+            with self._lock:
+                cola = self._colas[recipient_id]
+                if not cola:
+                    del self._colas[recipient_id]
+                    return
+                funcion, args = cola.popleft()
+            try:
+                resultado = funcion(*args)
+                clave = "fallidos" if resultado is False else "enviados"
+            except Exception as e:
+                print(f"[dispatcher] Error enviando a {recipient_id}: {e}")
+                clave = "fallidos"
+            with self._lock:
+                self.stats[clave] += 1
+
+    def pendientes(self):
+        with self._lock:
+            return sum(len(cola) for cola in self._colas.values())
+
+    def detener(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+dispatcher = OutboundDispatcher()
+
+def encolar_mensaje(recipient_id, message_text, buttons=None):
+    dispatcher.encolar(recipient_id, enviar_mensaje_whatsapp, recipient_id, message_text, buttons)
+    return True
+
+def encolar_accion_escritura(recipient_id, action='typing_on'):
+    dispatcher.encolar(recipient_id, enviar_accion_escritura, recipient_id, action)
+
+def encolar_pausa(recipient_id, segundos):
+    """Pausa entre dos mensajes del mismo usuario sin bloquear el hilo del webhook."""
+    dispatcher.encolar(recipient_id, time.sleep, segundos)
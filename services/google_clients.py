@@ -0,0 +1,33 @@
+# services/google_clients.py
+import os
+import threading
+
+# --- REGISTRO DE CLIENTES DE GOOGLE CLOUD ---
+# Cada cliente (Vision, Speech) se construye una sola vez por proceso: se leen las
+# credenciales y se abre el canal gRPC en el primer uso y luego se reutiliza.
+# Se guarda el PID con el que se creó: tras un fork (workers de gunicorn/celery) el
+# canal heredado no es seguro, así que el proceso hijo construye el suyo.
+GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", "credentials.json")
+
+_clientes = {}
+_lock = threading.Lock()
+
+def _get_cliente(nombre, fabrica):
+    pid = os.getpid()
+    item = _clientes.get(nombre)
+    if item is None or item[0] != pid:
+        with _lock:
+            item = _clientes.get(nombre)
+            if item is None or item[0] != pid:
+                item = (pid, fabrica())
+                _clientes[nombre] = item
+                print(f"[google] Cliente {nombre} inicializado (pid {pid}).")
+    return item[1]
+
+def get_vision_client():
+    from google.cloud import vision
+    return _get_cliente("vision", lambda: vision.ImageAnnotatorClient.from_service_account_json(GOOGLE_CREDENTIALS_PATH))
+
+def get_speech_client():
+    from google.cloud import speech
+    return _get_cliente("speech", lambda: speech.SpeechClient.from_service_account_json(GOOGLE_CREDENTIALS_PATH))
@@ -0,0 +1,130 @@
+# services/idempotencia.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# --- MENSAJES YA RECIBIDOS ---
+# Meta reintenta la entrega cuando el webhook tarda en responder, y aquí tarda porque el
+# OCR corre dentro de la petición. Cada reintento repetía la máquina de estados entera:
+# OCR duplicado, avisos duplicados al grupo de soporte y respuestas duplicadas. Cada
+# mensaje se marca por su wamid (message["id"]) antes de procesarlo; si ya estaba
+# marcado se descarta sin hacer nada. La marca es local (LRU con TTL) y, si hay Redis,
+# también compartida entre instancias con SET NX.
+# El backend se elige con IDEMPOTENCIA_BACKEND ("memory" o "redis"); si no se indica,
+# se usa Redis cuando existe REDIS_URL.
+IDEMPOTENCIA_BACKEND = os.getenv("IDEMPOTENCIA_BACKEND", "")
+IDEMPOTENCIA_TTL_SECONDS = int(os.getenv("IDEMPOTENCIA_TTL_SECONDS", str(7 * 24 * 3600)))  # Meta reintenta hasta 7 días
+IDEMPOTENCIA_MAX_ITEMS = int(os.getenv("IDEMPOTENCIA_MAX_ITEMS", "20000"))
+
+class MensajesVistos:
+    """Conjunto acotado de wamid con vencimiento; los más antiguos salen primero."""
+
+    def __init__(self, ttl=IDEMPOTENCIA_TTL_SECONDS, max_items=IDEMPOTENCIA_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._vistos = OrderedDict()  # wamid -> expira
+
+    def _purgar(self, ahora):
+        while self._vistos:
+            wamid, expira = next(iter(self._vistos.items()))
+            if expira > ahora and len(self._vistos) <= self.max_items:
+                break
+            del self._vistos[wamid]
+
+    def marcar(self, wamid):
+        """True si el wamid es nuevo (y queda marcado), False si ya se había visto."""
+        ahora = time.time()
+        with self._lock:
+            expira = self._vistos.get(wamid)
+            if expira is not None and expira > ahora:
+                self._vistos.move_to_end(wamid)
+                return False
+            self._vistos[wamid] = ahora + self.ttl
+            self._vistos.move_to_end(wamid)
+            self._purgar(ahora)
+            return True
+
+    def __len__(self):
+        return len(self._vistos)
+
+class RedisMensajesVistos:
+    """Marca compartida entre instancias: SET wamid 1 NX EX ttl."""
+
+    def __init__(self, url, ttl=IDEMPOTENCIA_TTL_SECONDS, prefix="wamid:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self._prefix = prefix
+
+    def marcar(self, wamid):
+        return bool(self._redis.set(self._prefix + wamid, 1, nx=True, ex=self.ttl))
+
+class FiltroDuplicados:
+
+    def __init__(self, compartido=None):
+        self._local = MensajesVistos()
+        self._compartido = compartido
+        self._lock = threading.Lock()
+        self.stats = {"recibidos": 0, "duplicados": 0, "sin_id": 0, "errores_redis": 0}
+
+    def es_nuevo(self, message_data):
+        """True si hay que procesar el mensaje; False si es un reintento de uno ya recibido."""
+        wamid = message_data.get("id")
+        if not wamid:
+            with self._lock:
+                self.stats["recibidos"] += 1
+                self.stats["sin_id"] += 1
+            return True
+        nuevo = self._local.marcar(wamid)
+        if nuevo and self._compartido is not None:
+            try:
+                nuevo = self._compartido.marcar(wamid)
+            except Exception as e:
+                # Sin Redis se sigue con la marca local: mejor un duplicado que perder el mensaje
+                print(f"[idempotencia] No se pudo consultar Redis ({e}); se usa solo la marca local.")
+                with self._lock:
+                    self.stats["errores_redis"] += 1
+        with self._lock:
+            self.stats["recibidos"] += 1
+            if not nuevo:
+                self.stats["duplicados"] += 1
+            duplicados, recibidos = self.stats["duplicados"], self.stats["recibidos"]
+        if not nuevo:
+            print(f"[idempotencia] {wamid} de {message_data.get('from')} ya se recibió; se descarta "
+                  f"({duplicados} duplicados de {recibidos}, {100 * duplicados / recibidos:.1f}%).")
+        return nuevo
+
+    def resumen(self):
+        """Mensajes recibidos, reintentos descartados y su proporción."""
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            "backend": "redis" if self._compartido is not None else "memory",
+            "recibidos": stats["recibidos"],
+            "duplicados": stats["duplicados"],
+            "tasa_duplicados": round(stats["duplicados"] / stats["recibidos"], 4) if stats["recibidos"] else 0.0,
+            "sin_id": stats["sin_id"],
+            "errores_redis": stats["errores_redis"],
+            "en_memoria": len(self._local),
+        }
+
+def crear_filtro_duplicados(backend=IDEMPOTENCIA_BACKEND):
+    redis_url = os.getenv("REDIS_URL")
+    if not backend:
+        backend = "redis" if redis_url else "memory"
+    if backend == "redis":
+        try:
+            compartido = RedisMensajesVistos(redis_url or "redis://localhost:6379/0")
+            compartido._redis.ping()
+            print("[idempotencia] Usando Redis para los mensajes ya recibidos.")
+            return FiltroDuplicados(compartido)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo usar Redis para la idempotencia ({e}). Se usará memoria.")
+    return FiltroDuplicados()
+
+filtro_duplicados = crear_filtro_duplicados()
+
+def es_mensaje_nuevo(message_data):
+    return filtro_duplicados.es_nuevo(message_data)
@@ -0,0 +1,95 @@
+# services/ingesta.py
+import time
+import threading
+
+# --- LOTES DEL WEBHOOK ---
+# Una entrega de Meta puede traer varias entradas, cada una con varios cambios y cada
+# cambio con varios mensajes (p. ej. un álbum de fotos, o texto e imagen enviados
+# seguidos). Se reciben todos: los de cada remitente, ordenados, van a su buzón
+# (services/turnos.py), que los atiende uno tras otro fuera del hilo del webhook, y los
+# de remitentes distintos corren en paralelo. El webhook responde a Meta en cuanto los
+# mensajes quedan encolados, sin esperar descargas ni OCR.
+
+def extraer_mensajes(data):
+    """Todos los mensajes de una entrega, en el orden en que vienen; ignora estados y cambios sin mensajes."""
+    mensajes = []
+    for entry in (data or {}).get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            mensajes.extend(m for m in value.get("messages") or [] if m.get("from"))
+    return mensajes
+
+def agrupar_por_remitente(mensajes):
+    """remitente -> mensajes ordenados por timestamp (orden de llegada si empatan)."""
+    grupos = {}
+    for mensaje in mensajes:
+        grupos.setdefault(mensaje["from"], []).append(mensaje)
+    for remitente, lista in grupos.items():
+        grupos[remitente] = sorted(lista, key=lambda m: int(m.get("timestamp") or 0))
+    return grupos
+
+class IngestaWebhook:
+
+    def __init__(self, encolar, es_nuevo=None):
+        self.encolar = encolar    # encolar(message_data): deja el turno en el buzón del remitente; False si no entra
+        self.es_nuevo = es_nuevo  # es_nuevo(message_data): False descarta el mensaje (reintento de Meta)
+        self._lock = threading.Lock()
+        self._inicio = time.time()
+        self.stats = {"entregas": 0, "vacias": 0, "mensajes": 0, "descartados": 0, "rechazados": 0, "lote_max": 0,
+                      "remitentes": 0, "remitentes_max": 0, "ms_total": 0.0, "ms_max": 0.0}
+
+    def procesar_lote(self, data):
+        """Encola los mensajes nuevos de una entrega, en orden por remitente, y vuelve. Devuelve cuántos eran."""
+        inicio = time.perf_counter()
+        mensajes = extraer_mensajes(data)
+        if self.es_nuevo is not None:
+            recibidos = len(mensajes)
+            mensajes = [m for m in mensajes if self.es_nuevo(m)]
+            if len(mensajes) < recibidos:
+                with self._lock:
+                    self.stats["descartados"] += recibidos - len(mensajes)
+        if not mensajes:
+            with self._lock:
+                self.stats["entregas"] += 1
+                self.stats["vacias"] += 1
+            return 0
+        grupos = agrupar_por_remitente(mensajes)
+        rechazados = 0
+        for lista in grupos.values():
+            for mensaje in lista:
+                if self.encolar(mensaje) is False:
+                    rechazados += 1
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.stats["entregas"] += 1
+            self.stats["mensajes"] += len(mensajes)
+            self.stats["rechazados"] += rechazados
+            self.stats["lote_max"] = max(self.stats["lote_max"], len(mensajes))
+            self.stats["remitentes"] += len(grupos)
+            self.stats["remitentes_max"] = max(self.stats["remitentes_max"], len(grupos))
+            self.stats["ms_total"] += ms
+            self.stats["ms_max"] = max(self.stats["ms_max"], ms)
+        if len(mensajes) > 1:
+            print(f"[ingesta] Lote de {len(mensajes)} mensajes de {len(grupos)} remitente(s) encolado en {ms:.1f}ms.")
+        return len(mensajes)
+
+    def resumen(self):
+        """Tamaño de los lotes, remitentes por lote, tiempo de respuesta a Meta y mensajes por segundo."""
+        with self._lock:
+            stats = dict(self.stats)
+        con_mensajes = (stats["entregas"] - stats["vacias"]) or 1
+        return {
+            "entregas": stats["entregas"],
+            "vacias": stats["vacias"],
+            "mensajes": stats["mensajes"],
+            "descartados": stats["descartados"],
+            "rechazados": stats["rechazados"],
+            "lote_prom": round(stats["mensajes"] / con_mensajes, 2),
+            "lote_max": stats["lote_max"],
+            "remitentes_prom": round(stats["remitentes"] / con_mensajes, 2),
+            "remitentes_max": stats["remitentes_max"],
+            # lo que tarda el webhook en responder; el procesamiento se mide en services/turnos.py
+            "ms_prom": round(stats["ms_total"] / con_mensajes, 2),
+            "ms_max": round(stats["ms_max"], 2),
+            "mensajes_por_s": round(stats["mensajes"] / max(time.time() - self._inicio, 1), 3),
+        }
@@ -0,0 +1,185 @@
+# services/ledger.py
+import os
+import csv
+import sqlite3
+import threading
+
+# --- LIBRO DE PAGOS (solo agregar) ---
+# Interfaz común para el registro de pagos. SqliteLedger es el backend por defecto:
+# modo WAL (lectores y un escritor concurrentes, también entre procesos), índices por
+# hash, cédula, documento y fecha, y UNIQUE sobre el hash para que la deduplicación
+# exacta la haga la base de datos de forma atómica. CsvLedger conserva el formato
+# anterior (pagos_registrados.csv) para quien todavía lo necesite.
+PAGOS_FIELDS = ["ts", "nombre", "cedula", "monto", "fecha", "documento", "banco", "image_ref", "hash"]
+
+class PaymentLedger:
+
+    def registrar(self, row):
+        """Agrega el pago; devuelve False si ya existe uno con el mismo hash."""
+        raise NotImplementedError
+
+    def cambios_desde(self, cursor):
+        """
+        Devuelve (hashes, nuevo_cursor, completo). Con completo=True los hashes son
+        todos los del libro; si no, solo los agregados después de `cursor`.
+        """
+        raise NotImplementedError
+
+    def historial(self, cedula, limite=10):
+        """Últimos pagos de un cliente, del más reciente al más antiguo."""
+        raise NotImplementedError
+
+class CsvLedger(PaymentLedger):
+
+    def __init__(self, path="pagos_registrados.csv"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _ensure_file(self):
+        if not os.path.exists(self.path):
+            with open(self.path, "w", encoding="utf-8-sig", newline="") as f:
+                csv.DictWriter(f, fieldnames=PAGOS_FIELDS).writeheader()
+
+    def _filas(self):
+        self._ensure_file()
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            return list(csv.DictReader(f))
+
+    def registrar(self, row):
+        with self._lock:
+            h = row.get("hash")
+            if h and any((r.get("hash") or "").strip() == h for r in self._filas()):
+                return False
+            with open(self.path, "a", encoding="utf-8-sig", newline="") as f:
+                csv.DictWriter(f, fieldnames=PAGOS_FIELDS).writerow(row)
+        return True
+
+    def cambios_desde(self, cursor):
+        self._ensure_file()
+        st = os.stat(self.path)
+        firma = (st.st_mtime_ns, st.st_size)
+        if firma == cursor:
+            return [], cursor, False
+        hashes = [(r.get("hash") or "").strip() for r in self._filas()]
+        return [h for h in hashes if h], firma, True
+
+    def historial(self, cedula, limite=10):
+        filas = [r for r in self._filas() if (r.get("cedula") or "").strip() == cedula]
+        return list(reversed(filas))[:limite]
+
+class SqliteLedger(PaymentLedger):
+
+    def __init__(self, path="pagos.db"):
+        self.path = path
+        self._local = threading.local()
+        self._crear_esquema()
+
+    def _conexion(self):
+        # Una conexión por hilo (y por proceso, por si hubo fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _crear_esquema(self):
+        conn = self._conexion()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pagos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts TEXT NOT NULL,
+                nombre TEXT,
+                cedula TEXT,
+                monto TEXT,
+                fecha TEXT,
+                documento TEXT,
+                banco TEXT,
+                image_ref TEXT,
+                hash TEXT UNIQUE
+            );
+            CREATE INDEX IF NOT EXISTS idx_pagos_cedula ON pagos (cedula, id);
+            CREATE INDEX IF NOT EXISTS idx_pagos_documento ON pagos (documento);
+            CREATE INDEX IF NOT EXISTS idx_pagos_ts ON pagos (ts);
+        """)
+
+    @staticmethod
+    def _valores(row):
+        valores = [(row.get(campo) or "").strip() for campo in PAGOS_FIELDS]
+        # Hash vacío -> NULL, para que UNIQUE no choque entre pagos sin hash
+        valores[-1] = valores[-1] or None
+        return valores
+
+    def registrar(self, row):
+        try:
+            self._conexion().execute(
+                f"INSERT INTO pagos ({', '.join(PAGOS_FIELDS)}) VALUES ({', '.join('?' * len(PAGOS_FIELDS))})",
+                self._valores(row),
+            )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def cambios_desde(self, cursor):
+        desde = cursor or 0
+        filas = self._conexion().execute(
+            "SELECT id, hash FROM pagos WHERE id > ? ORDER BY id", (desde,)
+        ).fetchall()
+        nuevo_cursor = filas[-1]["id"] if filas else desde
+        return [f["hash"] for f in filas if f["hash"]], nuevo_cursor, cursor is None
+
+    def historial(self, cedula, limite=10):
+        filas = self._conexion().execute(
+            f"SELECT {', '.join(PAGOS_FIELDS)} FROM pagos WHERE cedula = ? ORDER BY id DESC LIMIT ?",
+            (cedula, limite),
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def buscar_por_documento(self, documento):
+        filas = self._conexion().execute(
+            f"SELECT {', '.join(PAGOS_FIELDS)} FROM pagos WHERE documento = ? ORDER BY id", (documento,)
+        ).fetchall()
+        return [dict(f) for f in filas]
+
+    def esta_vacio(self):
+        return self._conexion().execute("SELECT 1 FROM pagos LIMIT 1").fetchone() is None
+
+    def migrar_desde_csv(self, csv_path):
+        """Importa pagos_registrados.csv; las filas con hash repetido se omiten. Devuelve las filas nuevas."""
+        if not os.path.exists(csv_path):
+            return 0
+        conn = self._conexion()
+        with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            filas = [self._valores(r) for r in csv.DictReader(f)]
+        antes = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO pagos ({', '.join(PAGOS_FIELDS)}) VALUES ({', '.join('?' * len(PAGOS_FIELDS))})",
+                filas,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - antes
+
+    def exportar_csv(self, csv_path):
+        """Vuelca el libro completo a CSV (para revisarlo en una hoja de cálculo)."""
+        filas = self._conexion().execute(f"SELECT {', '.join(PAGOS_FIELDS)} FROM pagos ORDER BY id")
+        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=PAGOS_FIELDS)
+            w.writeheader()
+            for fila in filas:
+                w.writerow({k: (fila[k] or "") for k in PAGOS_FIELDS})
+
+if __name__ == "__main__":
+    import sys
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "pagos_registrados.csv"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "pagos.db"
+    nuevas = SqliteLedger(db_path).migrar_desde_csv(csv_path)
+    print(f"[ledger] {nuevas} pagos migrados de {csv_path} a {db_path}.")
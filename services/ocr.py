@@ -0,0 +1,222 @@
+# services/ocr.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .google_clients import get_vision_client
+
+# --- CACHÉ DE RESULTADOS OCR POR CONTENIDO ---
+# La clave es el SHA-256 de los bytes enviados a Vision: si el cliente reenvía la misma
+# captura (o el mismo PDF, que se renderiza siempre a la misma imagen) no se vuelve a
+# pagar la llamada. Primer nivel LRU en memoria; segundo nivel opcional en disco o Redis
+# (OCR_CACHE_TIER = "disk" | "redis"). Los errores de Vision nunca se cachean.
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", str(24 * 3600)))
+OCR_CACHE_TIER = os.getenv("OCR_CACHE_TIER", "").strip().lower()
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+
+class DiskOcrTier:
+    def __init__(self, directory=OCR_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, digest):
+        path = os.path.join(self.directory, f"{digest}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                item = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if item.get("expira", 0) <= time.time():
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            return None
+        return item.get("texto")
+
+    def set(self, digest, texto, ttl):
+        path = os.path.join(self.directory, f"{digest}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"expira": time.time() + ttl, "texto": texto}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+class RedisOcrTier:
+    def __init__(self, url, prefix="ocr:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, digest):
+        raw = self._redis.get(self._prefix + digest)
+        return raw.decode('utf-8') if raw is not None else None
+
+    def set(self, digest, texto, ttl):
+        self._redis.set(self._prefix + digest, texto.encode('utf-8'), ex=ttl)
+
+class OcrCache:
+
+    def __init__(self, max_items=OCR_CACHE_SIZE, ttl=OCR_CACHE_TTL_SECONDS, tier=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.tier = tier
+        self._items = OrderedDict()  # digest -> (expira, texto)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "hits_tier": 0, "misses": 0}
+
+    @staticmethod
+    def digest(contenido):
+        return hashlib.sha256(contenido).hexdigest()
+
+    def _guardar_local(self, digest, texto):
+        with self._lock:
+            self._items[digest] = (time.time() + self.ttl, texto)
+            self._items.move_to_end(digest)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, digest):
+        with self._lock:
+            item = self._items.get(digest)
+            if item is not None:
+                if item[0] > time.time():
+                    self._items.move_to_end(digest)
+                    self.stats["hits"] += 1
+                    return item[1]
+                del self._items[digest]
+        if self.tier is not None:
+            try:
+                texto = self.tier.get(digest)
+            except Exception as e:
+                print(f"[ocr_cache] Error leyendo segundo nivel: {e}")
+                texto = None
+            if texto is not None:
+                self._guardar_local(digest, texto)
+                with self._lock:
+                    self.stats["hits_tier"] += 1
+                return texto
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, digest, texto):
+        self._guardar_local(digest, texto)
+        if self.tier is not None:
+            try:
+                self.tier.set(digest, texto, self.ttl)
+            except Exception as e:
+                print(f"[ocr_cache] Error escribiendo segundo nivel: {e}")
+
+    def resumen(self):
+        """Aciertos en memoria y en el segundo nivel, fallos y proporción de llamadas a Vision evitadas."""
+        with self._lock:
+            stats = dict(self.stats)
+            en_memoria = len(self._items)
+        consultas = stats["hits"] + stats["hits_tier"] + stats["misses"]
+        return {
+            "hits": stats["hits"],
+            "hits_tier": stats["hits_tier"],
+            "misses": stats["misses"],
+            "tasa_aciertos": round((stats["hits"] + stats["hits_tier"]) / consultas, 4) if consultas else 0.0,
+            "en_memoria": en_memoria,
+            "segundo_nivel": OCR_CACHE_TIER if self.tier is not None else None,
+        }
+
+def _crear_tier():
+    if OCR_CACHE_TIER == "disk":
+        return DiskOcrTier()
+    if OCR_CACHE_TIER == "redis":
+        try:
+            return RedisOcrTier(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo usar Redis para la caché OCR ({e}).")
+    return None
+
+ocr_cache = OcrCache(tier=_crear_tier())
+
+def _leer_texto(image_content):
+    # (texto, error, desde_cache)
+    digest = OcrCache.digest(image_content)
+    texto = ocr_cache.get(digest)
+    if texto is not None:
+        return texto, None, True
+
+    from google.cloud import vision
+    response = get_vision_client().text_detection(image=vision.Image(content=image_content))
+    if response.error.message:
+        print(f"Error en OCR: {response.error.message}")
+        return None, response.error.message, False
+
+    texto = response.text_annotations[0].description if response.text_annotations else ""
+    ocr_cache.set(digest, texto)
+    return texto, None, False
+
+def extraer_texto_ocr(image_content):
+    """
+    Devuelve (texto_completo_ocr, error). error es el mensaje de Vision si la
+    llamada falló; en ese caso texto_completo_ocr es None.
+    """
+    texto, error, _ = _leer_texto(image_content)
+    return texto, error
+
+# --- TAMAÑO Y LATENCIA DE SUBIDA ---
+class SubidaStats:
+    """
+    Bytes originales vs. enviados y tiempo de preparación/Vision por comprobante. Los
+    aciertos de ocr_cache no llegan a Vision: se cuentan aparte, fuera de los promedios.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totales = {"comprobantes": 0, "bytes_originales": 0, "bytes_enviados": 0,
+                         "preparacion_ms": 0.0, "vision_ms": 0.0, "desde_cache": 0}
+
+    def registrar_cache(self):
+        with self._lock:
+            self._totales["desde_cache"] += 1
+
+    def registrar(self, bytes_originales, bytes_enviados, preparacion_ms, vision_ms):
+        with self._lock:
+            t = self._totales
+            t["comprobantes"] += 1
+            t["bytes_originales"] += bytes_originales
+            t["bytes_enviados"] += bytes_enviados
+            t["preparacion_ms"] += preparacion_ms
+            t["vision_ms"] += vision_ms
+
+    def resumen(self):
+        with self._lock:
+            t = dict(self._totales)
+        n = t["comprobantes"] or 1
+        return {
+            "comprobantes": t["comprobantes"],
+            "desde_cache": t["desde_cache"],
+            "kb_originales_prom": round(t["bytes_originales"] / n / 1024, 1),
+            "kb_enviados_prom": round(t["bytes_enviados"] / n / 1024, 1),
+            "ahorro_bytes": round(1 - t["bytes_enviados"] / t["bytes_originales"], 3) if t["bytes_originales"] else 0.0,
+            "preparacion_ms_prom": round(t["preparacion_ms"] / n, 1),
+            "vision_ms_prom": round(t["vision_ms"] / n, 1),
+        }
+
+subida_stats = SubidaStats()
+
+def extraer_texto_comprobante(recibo):
+    """extraer_texto_ocr sobre los bytes preparados de un ReceiptImage, con el reporte de tamaño y tiempos."""
+    inicio = time.perf_counter()
+    contenido = recibo.bytes_subida
+    preparacion_ms = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    texto, error, desde_cache = _leer_texto(contenido)
+    vision_ms = (time.perf_counter() - inicio) * 1000
+
+    if desde_cache:
+        subida_stats.registrar_cache()
+        print(f"[ocr] Texto tomado de la caché ({ocr_cache.resumen()['tasa_aciertos']:.0%} de aciertos), sin llamar a Vision.")
+        return texto, error
+    original = len(recibo.contenido) or 1
+    subida_stats.registrar(original, len(contenido), preparacion_ms, vision_ms)
+    print(f"[ocr] {original / 1024:.0f} KB -> {len(contenido) / 1024:.0f} KB "
+          f"({1 - len(contenido) / original:.0%} menos), preparación={preparacion_ms:.0f}ms vision={vision_ms:.0f}ms")
+    return texto, error
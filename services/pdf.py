@@ -0,0 +1,96 @@
+# services/pdf.py
+import os
+
+from .concurrencia import HilosPorProceso
+from .ocr import extraer_texto_comprobante
+from .receipt_image import ReceiptImage, calcular_vistas
+from .cpu_pool import ejecutar_cpu
+
+# --- COMPROBANTES EN PDF ---
+# Casi todos los PDF que generan las apps bancarias traen capa de texto: se lee con
+# get_text() y no se renderiza ni se llama a Vision. Solo las páginas sin texto útil
+# (escaneos, capturas guardadas como PDF) se renderizan en memoria y pasan por OCR,
+# cada una en su hilo. La primera página se renderiza siempre a baja resolución para
+# el phash de duplicados. Todo lo que usa PyMuPDF o PIL corre en el pool de procesos.
+PDF_MAX_PAGINAS = int(os.getenv("PDF_MAX_PAGINAS", "5"))
+PDF_TEXTO_MIN_CARACTERES = 40   # menos letras/dígitos que esto se trata como página escaneada
+PDF_LADO_OBJETIVO_PX = 2000     # lado mayor de la página renderizada para Vision
+PDF_ZOOM_MIN, PDF_ZOOM_MAX = 1.0, 4.0
+PDF_ZOOM_PHASH = 1.0            # phash reduce a 32x32: basta con 72 DPI
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "4"))
+
+class ComprobantePdf:
+    """Texto de todas las páginas en orden, ReceiptImage de la primera página y cómo se obtuvo cada una."""
+    __slots__ = ('texto', 'recibo', 'origenes', 'error')
+
+    def __init__(self, texto, recibo, origenes, error=None):
+        self.texto = texto
+        self.recibo = recibo
+        self.origenes = origenes  # por página: "texto" u "ocr"
+        self.error = error        # mensaje de Vision si alguna página no se pudo leer
+
+    @property
+    def uso_ocr(self):
+        return "ocr" in self.origenes
+
+def texto_util(texto):
+    return sum(c.isalnum() for c in texto) >= PDF_TEXTO_MIN_CARACTERES
+
+def zoom_adaptativo(ancho_pt, alto_pt):
+    """Zoom para que el lado mayor quede en PDF_LADO_OBJETIVO_PX (1 pt = 1 px a zoom 1)."""
+    lado = max(ancho_pt, alto_pt) or 1
+    return min(max(PDF_LADO_OBJETIVO_PX / lado, PDF_ZOOM_MIN), PDF_ZOOM_MAX)
+
+def _renderizar(pagina, zoom):
+    import fitz
+    return pagina.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("png")
+
+def _leer_paginas(pdf_content):
+    # Corre en el pool de procesos: (textos, páginas sin texto, (png, vistas) de la primera página o None)
+    import fitz
+    with fitz.open(stream=pdf_content, filetype="pdf") as documento:
+        total = min(len(documento), PDF_MAX_PAGINAS)
+        textos = [documento[i].get_text() for i in range(total)]
+        sin_texto = [i for i, texto in enumerate(textos) if not texto_util(texto)]
+        if not total or 0 in sin_texto:
+            return textos, sin_texto, None
+        imagen = _renderizar(documento[0], PDF_ZOOM_PHASH)
+    return textos, sin_texto, (imagen, calcular_vistas(imagen, validar=False)[2])
+
+def _renderizar_para_ocr(pdf_content, numero):
+    # Corre en el pool de procesos: cada tarea abre su propio documento
+    import fitz
+    with fitz.open(stream=pdf_content, filetype="pdf") as documento:
+        pagina = documento[numero]
+        imagen = _renderizar(pagina, zoom_adaptativo(pagina.rect.width, pagina.rect.height))
+    return imagen, calcular_vistas(imagen, validar=False)[2]
+
+def _ocr_pagina(pdf_content, numero):
+    recibo = ReceiptImage.desde_vistas(*ejecutar_cpu(_renderizar_para_ocr, pdf_content, numero))
+    texto, error = extraer_texto_comprobante(recibo)
+    return texto, error, recibo
+
+_hilos = HilosPorProceso(PDF_WORKERS, "pdf")
+
+def leer_comprobante_pdf(pdf_content):
+    """
+    ComprobantePdf con el texto de las primeras PDF_MAX_PAGINAS páginas, o None si el
+    PDF no tiene páginas. Lanza la excepción de PyMuPDF si el archivo está dañado.
+    """
+    textos, sin_texto, primera = ejecutar_cpu(_leer_paginas, pdf_content)
+    total = len(textos)
+    if not total:
+        return None
+    recibo = ReceiptImage.desde_vistas(*primera) if primera else None
+
+    origenes = ["ocr" if i in sin_texto else "texto" for i in range(total)]
+    error = None
+    if sin_texto:
+        resultados = _hilos.get().map(lambda i: _ocr_pagina(pdf_content, i), sin_texto)
+        for i, (texto, error_pagina, recibo_pagina) in zip(sin_texto, resultados):
+            textos[i] = texto or ""
+            error = error or error_pagina
+            if i == 0:
+                recibo = recibo_pagina  # la primera página ya se renderizó para Vision
+    print(f"[pdf] {total} página(s): " + ", ".join(origenes))
+    return ComprobantePdf("\n".join(textos), recibo, origenes, error)
@@ -0,0 +1,90 @@
+# services/phash_index.py
+
+# --- ÍNDICE DE HASHES PERCEPTUALES (MULTI-INDEX HASHING) ---
+# Los phash de imagehash son de 64 bits (16 dígitos hex). Para encontrar hashes a
+# distancia de Hamming <= d se parten los 64 bits en d + 1 bloques: por el principio
+# del palomar, dos hashes a distancia <= d coinciden exactamente en al menos un bloque.
+# Cada bloque tiene su tabla hash, así que solo se comparan los pocos candidatos que
+# comparten algún bloque, sin recorrer la lista completa. Con esto una captura
+# recortada o recomprimida también se detecta como duplicada.
+
+def hash_a_int(hash_str):
+    try:
+        return int(str(hash_str).strip(), 16)
+    except (TypeError, ValueError):
+        return None
+
+def distancia_hamming(a, b):
+    return (a ^ b).bit_count()
+
+class MultiIndexHash:
+
+    def __init__(self, max_distancia, bits=64):
+        self.max_distancia = max_distancia
+        self._valores = set()
+        num_bloques = max_distancia + 1
+        # (desplazamiento, máscara) de cada bloque, repartiendo los bits lo más parejo posible
+        self._bloques = []
+        inicio = 0
+        for i in range(num_bloques):
+            ancho = bits // num_bloques + (1 if i < bits % num_bloques else 0)
+            self._bloques.append((inicio, (1 << ancho) - 1))
+            inicio += ancho
+        self._tablas = [{} for _ in self._bloques]
+
+    def __len__(self):
+        return len(self._valores)
+
+    def agregar(self, valor):
+        if valor in self._valores:
+            return
+        self._valores.add(valor)
+        for (desplazamiento, mascara), tabla in zip(self._bloques, self._tablas):
+            tabla.setdefault((valor >> desplazamiento) & mascara, []).append(valor)
+
+    def buscar(self, valor, max_distancia=None):
+        """Devuelve [(distancia, valor)] de todos los elementos a distancia <= max_distancia."""
+        if max_distancia is None:
+            max_distancia = self.max_distancia
+        if max_distancia > self.max_distancia:
+            # El palomar ya no garantiza nada con más bloques distintos: búsqueda lineal
+            candidatos = self._valores
+        else:
+            candidatos = set()
+            for (desplazamiento, mascara), tabla in zip(self._bloques, self._tablas):
+                candidatos.update(tabla.get((valor >> desplazamiento) & mascara, ()))
+        encontrados = []
+        for candidato in candidatos:
+            d = distancia_hamming(valor, candidato)
+            if d <= max_distancia:
+                encontrados.append((d, candidato))
+        return encontrados
+
+class PhashIndex:
+    """Hashes exactos (texto) más el índice por bloques para consultas por similitud."""
+
+    def __init__(self, hashes=(), max_distancia=4):
+        self.exactos = set()
+        self.similares = MultiIndexHash(max_distancia)
+        for h in hashes:
+            self.agregar(h)
+
+    def agregar(self, hash_str):
+        hash_str = str(hash_str or "").strip()
+        if not hash_str or hash_str in self.exactos:
+            return
+        self.exactos.add(hash_str)
+        valor = hash_a_int(hash_str)
+        if valor is not None:
+            self.similares.agregar(valor)
+
+    def contiene(self, hash_str, max_distancia=0):
+        hash_str = str(hash_str or "").strip()
+        if not hash_str:
+            return False
+        if hash_str in self.exactos:
+            return True
+        valor = hash_a_int(hash_str)
+        if valor is None or max_distancia <= 0:
+            return False
+        return bool(self.similares.buscar(valor, max_distancia))
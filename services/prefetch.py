@@ -0,0 +1,148 @@
+# services/prefetch.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .meta_api import obtener_contenido_imagen, obtener_contenido_documento
+from .concurrencia import cronometrar
+from .ocr import extraer_texto_comprobante
+from .pdf import leer_comprobante_pdf
+
+# --- LECTURA DEL COMPROBANTE ---
+# Descarga, validación, phash y OCR de una imagen o PDF, sin tocar la conversación.
+# La usan tanto el flujo normal como la lectura anticipada.
+class ComprobanteLeido:
+    """
+    recibo (ReceiptImage) y texto OCR, o error: "descarga" (mensaje trae el texto para el
+    usuario), "pdf" (archivo dañado), "pdf_vacio" u "ocr".
+    """
+    __slots__ = ('recibo', 'texto', 'error', 'mensaje')
+
+    def __init__(self, recibo=None, texto=None, error=None, mensaje=None):
+        self.recibo = recibo
+        self.texto = texto
+        self.error = error
+        self.mensaje = mensaje
+
+def leer_imagen(media_id, user_id):
+    recibo, mensaje = obtener_contenido_imagen(media_id, user_id)
+    if not recibo:
+        return ComprobanteLeido(error="descarga", mensaje=mensaje)
+    texto, ocr_error = extraer_texto_comprobante(recibo)
+    if ocr_error:
+        return ComprobanteLeido(recibo, error="ocr")
+    return ComprobanteLeido(recibo, texto)
+
+def leer_pdf(media_id):
+    pdf_content, mensaje = obtener_contenido_documento(media_id)
+    if not pdf_content:
+        return ComprobanteLeido(error="descarga", mensaje=mensaje)
+    try:
+        # Todo en memoria: capa de texto si la hay, OCR solo de las páginas escaneadas
+        comprobante = leer_comprobante_pdf(pdf_content)
+    except Exception as e:
+        print(f"Error al procesar el documento PDF: {e}")
+        return ComprobanteLeido(error="pdf")
+    if comprobante is None:
+        return ComprobanteLeido(error="pdf_vacio")
+    if comprobante.error:
+        return ComprobanteLeido(comprobante.recibo, error="ocr")
+    return ComprobanteLeido(comprobante.recibo, comprobante.texto)
+
+# --- LECTURA ANTICIPADA ---
+# Cuando llega un archivo sin contexto (paso awaiting_id_for_file) el cliente todavía
+# tiene que escribir el nombre y elegir el titular. Mientras tanto la lectura ya corre en
+# segundo plano; el resultado queda en memoria indexado por media_id, que es lo que
+# guarda la sesión, y se toma al confirmar el titular. Si otra instancia atiende la
+# confirmación o el resultado expiró, se lee de nuevo como siempre.
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_TTL_SECONDS = int(os.getenv("PREFETCH_TTL_SECONDS", str(30 * 60)))  # igual que la sesión
+PREFETCH_MAX_ITEMS = int(os.getenv("PREFETCH_MAX_ITEMS", "64"))
+PREFETCH_TIMEOUT_SECONDS = 120
+
+class Prefetcher:
+
+    def __init__(self, max_workers=PREFETCH_WORKERS, ttl=PREFETCH_TTL_SECONDS, max_items=PREFETCH_MAX_ITEMS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._tareas = OrderedDict()  # media_id -> (expira, futuro)
+        self.stats = {"iniciadas": 0, "aprovechadas": 0, "descartadas": 0, "fallidas": 0,
+                      "espera_restante_ms": 0.0, "lectura_ms": 0.0}
+
+    def _purgar(self):
+        ahora = time.time()
+        while self._tareas:
+            media_id, (expira, _) = next(iter(self._tareas.items()))
+            if expira > ahora and len(self._tareas) <= self.max_items:
+                break
+            del self._tareas[media_id]
+            self.stats["descartadas"] += 1
+
+    def iniciar(self, media_id, funcion, *args):
+        """Empieza funcion(*args) en segundo plano, salvo que ya haya una lectura para ese media_id."""
+        with self._lock:
+            if media_id in self._tareas:
+                return
+            self._tareas[media_id] = (time.time() + self.ttl, self._executor.submit(cronometrar, funcion, args))
+            self.stats["iniciadas"] += 1
+            self._purgar()
+
+    def listo(self, media_id):
+        with self._lock:
+            item = self._tareas.get(media_id)
+        return item is not None and item[1].done()
+
+    def tomar(self, media_id):
+        """El ComprobanteLeido anticipado (esperando si aún corre), o None si no hay o falló."""
+        with self._lock:
+            item = self._tareas.pop(media_id, None)
+        if item is None:
+            return None
+        expira, futuro = item
+        if expira <= time.time():
+            with self._lock:
+                self.stats["descartadas"] += 1
+            return None
+        espera = time.perf_counter()
+        try:
+            resultado, lectura_ms = futuro.result(timeout=PREFETCH_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"[prefetch] La lectura anticipada de {media_id} falló: {e}")
+            with self._lock:
+                self.stats["fallidas"] += 1
+            return None
+        espera_ms = (time.perf_counter() - espera) * 1000
+        with self._lock:
+            self.stats["aprovechadas"] += 1
+            self.stats["espera_restante_ms"] += espera_ms
+            self.stats["lectura_ms"] += lectura_ms
+        print(f"[prefetch] {media_id}: lectura de {lectura_ms:.0f}ms, el cliente esperó {espera_ms:.0f}ms.")
+        return resultado
+
+    def resumen(self):
+        """Lecturas aprovechadas y cuánto del tiempo de lectura el cliente no tuvo que esperar."""
+        with self._lock:
+            stats = dict(self.stats)
+            en_curso = len(self._tareas)
+        aprovechadas = stats["aprovechadas"] or 1
+        return {
+            "en_curso": en_curso,
+            "iniciadas": stats["iniciadas"],
+            "aprovechadas": stats["aprovechadas"],
+            "descartadas": stats["descartadas"],
+            "fallidas": stats["fallidas"],
+            "espera_restante_ms_prom": round(stats["espera_restante_ms"] / aprovechadas, 1),
+            "lectura_ms_prom": round(stats["lectura_ms"] / aprovechadas, 1),
+        }
+
+prefetcher = Prefetcher()
+
+def anticipar_lectura(media_id, user_id, is_pdf):
+    if is_pdf:
+        prefetcher.iniciar(media_id, leer_pdf, media_id)
+    else:
+        prefetcher.iniciar(media_id, leer_imagen, media_id, user_id)
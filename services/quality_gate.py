@@ -0,0 +1,117 @@
+# services/quality_gate.py
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# --- FILTRO DE CALIDAD ANTES DEL OCR ---
+# Una foto movida, diminuta o mal iluminada pasa por Vision (lento y pagado) y después
+# falla es_comprobante_valido de todas formas. Con la imagen ya decodificada en gris se
+# miden, en unos pocos ms, nitidez (varianza del laplaciano), contraste (percentiles
+# 1-99), resolución y densidad de bordes tipo texto, y se rechaza antes de subirla.
+# Las métricas se calculan sobre una copia con el lado mayor en ANALISIS_LADO px para
+# que los umbrales no dependan del tamaño original (las más chicas se miden tal cual).
+ANALISIS_LADO = 1000
+MIN_LADO_CORTO_PX = int(os.getenv("CALIDAD_MIN_LADO_CORTO_PX", "300"))
+MIN_LADO_LARGO_PX = int(os.getenv("CALIDAD_MIN_LADO_LARGO_PX", "500"))
+MIN_NITIDEZ = float(os.getenv("CALIDAD_MIN_NITIDEZ", "25"))        # varianza del laplaciano
+MIN_CONTRASTE = float(os.getenv("CALIDAD_MIN_CONTRASTE", "40"))    # percentil 99 - percentil 1
+MIN_BRILLO, MAX_BRILLO = 35, 245
+MIN_DENSIDAD_TEXTO = float(os.getenv("CALIDAD_MIN_DENSIDAD_TEXTO", "0.004"))
+UMBRAL_BORDE = 30  # |laplaciano| a partir del cual un píxel cuenta como borde de letra
+
+MENSAJES_RECHAZO = {
+    "resolucion": "🔍 **Imagen muy pequeña**\n\nLa imagen tiene muy poca resolución para leer el comprobante. Envía una captura de pantalla o una foto más cercana.",
+    "borrosa": "📷 **Imagen borrosa**\n\nNo se puede leer el comprobante porque la foto está movida o desenfocada. Apoya el teléfono y vuelve a tomarla, o envía una captura de pantalla.",
+    "oscura": "💡 **Imagen muy oscura**\n\nEl comprobante no se distingue. Toma la foto con más luz o envía una captura de pantalla.",
+    "clara": "💡 **Imagen sobreexpuesta**\n\nHay demasiado brillo o reflejo sobre el comprobante. Evita el flash y vuelve a tomar la foto.",
+    "contraste": "🌫️ **Poco contraste**\n\nEl texto casi no se distingue del fondo. Toma la foto con mejor iluminación o envía una captura de pantalla.",
+    "sin_texto": "📝 **No se ve texto**\n\nLa imagen no parece contener un comprobante. Envía la captura o foto del comprobante de pago.",
+}
+
+def medir_calidad(gris, tamano_original):
+    """Métricas de calidad de una imagen PIL en modo L; tamano_original es (ancho, alto) antes de reducirla."""
+    if max(gris.size) > ANALISIS_LADO:
+        gris = gris.copy()
+        gris.thumbnail((ANALISIS_LADO, ANALISIS_LADO), Image.Resampling.BOX, reducing_gap=2.0)
+    a = np.asarray(gris, dtype=np.float32)
+    laplaciano = a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4 * a[1:-1, 1:-1]
+    # Percentiles 1-99 para que unos pocos píxeles saturados no cuenten como contraste. En
+    # una captura con poco texto, p1 y p99 caen los dos en el fondo blanco y el contraste
+    # da ~0: por eso motivo_rechazo solo lo usa junto con nitidez o bordes bajos.
+    p1, p99 = np.percentile(a, (1, 99))
+    return {
+        "ancho": tamano_original[0],
+        "alto": tamano_original[1],
+        "nitidez": float(laplaciano.var()) if laplaciano.size else 0.0,
+        "contraste": float(p99 - p1),
+        "brillo": float(a.mean()),
+        "densidad_texto": float(np.count_nonzero(np.abs(laplaciano) > UMBRAL_BORDE) / laplaciano.size) if laplaciano.size else 0.0,
+    }
+
+def motivo_rechazo(metricas):
+    """Clave de MENSAJES_RECHAZO, o None si la imagen se puede enviar al OCR."""
+    corto, largo = sorted((metricas["ancho"], metricas["alto"]))
+    if corto < MIN_LADO_CORTO_PX or largo < MIN_LADO_LARGO_PX:
+        return "resolucion"
+    sin_detalle = metricas["nitidez"] < MIN_NITIDEZ or metricas["densidad_texto"] < MIN_DENSIDAD_TEXTO
+    if metricas["contraste"] < MIN_CONTRASTE and sin_detalle:
+        # Texto nítido con bordes de sobra (una captura de fondo blanco) no es una foto lavada
+        if metricas["brillo"] < MIN_BRILLO:
+            return "oscura"
+        return "clara" if metricas["brillo"] > MAX_BRILLO else "contraste"
+    if metricas["nitidez"] < MIN_NITIDEZ:
+        return "borrosa"
+    if metricas["densidad_texto"] < MIN_DENSIDAD_TEXTO:
+        return "sin_texto"
+    return None
+
+class GateStats:
+    """Imágenes evaluadas y rechazadas por motivo; cada rechazo es una llamada a Vision ahorrada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.evaluadas = 0
+        self.rechazos = {}
+        self._ms_total = 0.0
+
+    def registrar(self, motivo, ms):
+        with self._lock:
+            self.evaluadas += 1
+            self._ms_total += ms
+            if motivo:
+                self.rechazos[motivo] = self.rechazos.get(motivo, 0) + 1
+            ahorrados, evaluadas = sum(self.rechazos.values()), self.evaluadas
+        if motivo:
+            print(f"[calidad] {ahorrados} llamadas a Vision ahorradas de {evaluadas} imágenes evaluadas.")
+
+    def resumen(self):
+        with self._lock:
+            return {
+                "evaluadas": self.evaluadas,
+                "ocr_ahorrados": sum(self.rechazos.values()),
+                "rechazos": dict(self.rechazos),
+                "ms_prom": round(self._ms_total / self.evaluadas, 2) if self.evaluadas else 0.0,
+            }
+
+gate_stats = GateStats()
+
+def evaluar_calidad(recibo, registrar=True):
+    """
+    (es_legible, mensaje, metricas) para un ReceiptImage. Deja (motivo, ms) en
+    recibo.calidad; registrar=False no lo suma a gate_stats (lo hace quien recibe el
+    resultado desde el pool de procesos).
+    """
+    inicio = time.perf_counter()
+    metricas = medir_calidad(recibo.gris, recibo.tamano_original)
+    motivo = motivo_rechazo(metricas)
+    ms = (time.perf_counter() - inicio) * 1000
+    recibo.calidad = (motivo, ms)
+    if registrar:
+        gate_stats.registrar(motivo, ms)
+    if motivo:
+        print(f"[calidad] Rechazada ({motivo}) en {ms:.1f}ms: " + ", ".join(f"{k}={v:.3g}" for k, v in metricas.items()))
+        return False, MENSAJES_RECHAZO[motivo], metricas
+    return True, "✅ Imagen válida", metricas
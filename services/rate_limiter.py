@@ -0,0 +1,93 @@
+# services/rate_limiter.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# --- RATE LIMITING POR VENTANA DESLIZANTE ---
+# Contador de ventana deslizante aproximada: se guardan solo el conteo de la ventana
+# actual y el de la anterior, y la anterior se pondera por la fracción que aún
+# cae dentro de los últimos `window_seconds`. El costo por mensaje es constante.
+
+class MemoryRateLimiter:
+    """Contadores en memoria del proceso, protegidos con un lock."""
+
+    def __init__(self, limit, window_seconds=60):
+        self.limit = limit
+        self.window = window_seconds
+        self._lock = threading.Lock()
+        # user_id -> [inicio_ventana, conteo_actual, conteo_anterior], ordenado por último uso
+        self._counters = OrderedDict()
+
+    def _purgar(self, now):
+        # Los usuarios sin mensajes en dos ventanas ya no aportan nada; se quitan desde
+        # el más antiguo, así que el costo amortizado sigue siendo O(1).
+        while self._counters:
+            user_id, counter = next(iter(self._counters.items()))
+            if now - counter[0] < 2 * self.window:
+                break
+            self._counters.popitem(last=False)
+
+    def permitir(self, user_id, now=None):
+        now = time.time() if now is None else now
+        inicio = now - (now % self.window)
+        with self._lock:
+            counter = self._counters.get(user_id)
+            if counter is None:
+                counter = [inicio, 0, 0]
+                self._counters[user_id] = counter
+            elif counter[0] != inicio:
+                anterior = counter[1] if inicio - counter[0] == self.window else 0
+                counter[:] = [inicio, 0, anterior]
+            self._counters.move_to_end(user_id)
+            self._purgar(now)
+
+            peso = 1 - (now - inicio) / self.window
+            if counter[2] * peso + counter[1] >= self.limit:
+                return False
+            counter[1] += 1
+            return True
+
+# Comprueba y suma en una sola operación atómica del servidor
+_REDIS_SLIDING_WINDOW = """
+local actual = tonumber(redis.call('GET', KEYS[1]) or '0')
+local anterior = tonumber(redis.call('GET', KEYS[2]) or '0')
+if anterior * tonumber(ARGV[2]) + actual >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+class RedisRateLimiter:
+    """Mismo algoritmo con contadores en Redis, compartidos entre instancias."""
+
+    def __init__(self, url, limit, window_seconds=60, prefix="ratelimit:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_SLIDING_WINDOW)
+        self.limit = limit
+        self.window = window_seconds
+        self._prefix = prefix
+
+    def permitir(self, user_id, now=None):
+        now = time.time() if now is None else now
+        ventana = int(now // self.window)
+        peso = 1 - (now % self.window) / self.window
+        keys = [f"{self._prefix}{user_id}:{ventana}", f"{self._prefix}{user_id}:{ventana - 1}"]
+        return bool(self._script(keys=keys, args=[self.limit, peso, 2 * self.window]))
+
+def crear_rate_limiter(limit, window_seconds=60):
+    backend = os.getenv("RATE_LIMIT_BACKEND", "").strip().lower()
+    redis_url = os.getenv("REDIS_URL")
+    if not backend:
+        backend = "redis" if redis_url else "memory"
+    if backend == "redis":
+        try:
+            limiter = RedisRateLimiter(redis_url or "redis://localhost:6379/0", limit, window_seconds)
+            limiter._redis.ping()
+            return limiter
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo usar Redis para rate limiting ({e}). Se usará memoria.")
+    return MemoryRateLimiter(limit, window_seconds)
@@ -0,0 +1,181 @@
+# services/receipt_image.py
+import os
+from io import BytesIO
+from PIL import Image
+
+from .utils import BOT_CONFIG
+from .quality_gate import evaluar_calidad, gate_stats
+from .cpu_pool import ejecutar_cpu
+
+# --- IMAGEN DEL COMPROBANTE: UNA SOLA DECODIFICACIÓN ---
+# Validación, phash, miniatura y OCR trabajan sobre el mismo objeto. Los bytes se
+# decodifican una sola vez (los JPEG grandes en modo draft, que el decodificador reduce
+# directamente a 1/2, 1/4 u 1/8) y cada vista se calcula la primera vez que se pide.
+IMAGEN_MAX_LADO = 1600          # phash, validación y miniatura no necesitan más
+MINIATURA_TAMANO = (800, 600)
+MINIATURA_CALIDAD = 60
+
+# --- PREPARACIÓN PARA VISION ---
+# Las fotos y capturas llegan con varios MB y la subida domina la latencia del OCR.
+# Antes de enviarlas se limita el lado mayor, se pasan a gris (Vision no usa el color
+# para leer texto) y se recomprimen en JPEG. Si el resultado no pesa menos, se envía
+# el original.
+OCR_MAX_LADO = int(os.getenv("OCR_MAX_LADO", "2000"))
+OCR_CALIDAD_JPEG = int(os.getenv("OCR_CALIDAD_JPEG", "85"))
+OCR_ESCALA_GRISES = os.getenv("OCR_ESCALA_GRISES", "1") != "0"
+OCR_MIN_BYTES_RECOMPRIMIR = 150 * 1024  # por debajo, recomprimir cuesta más de lo que ahorra
+# La decodificación compartida tiene que alcanzar también para la subida: si draft
+# apuntara solo a IMAGEN_MAX_LADO, Vision recibiría ~1600 px aunque OCR_MAX_LADO pida más.
+DECODIFICAR_LADO = max(IMAGEN_MAX_LADO, OCR_MAX_LADO)
+
+class ReceiptImage:
+    """Bytes del comprobante y sus vistas derivadas (gris, phash, miniatura), memorizadas."""
+    __slots__ = ('contenido', '_abierta', '_imagen', '_gris', '_phash', '_miniatura', '_subida', '_tamano', 'calidad')
+
+    def __init__(self, contenido):
+        self.contenido = contenido
+        self._abierta = None   # Image.open: solo lee el encabezado
+        self._imagen = None
+        self._gris = None
+        self._phash = None
+        self._miniatura = None
+        self._subida = None
+        self._tamano = None    # tamaño real, antes de que draft lo reduzca
+        self.calidad = None    # (motivo de rechazo o None, ms) del filtro de calidad
+
+    @classmethod
+    def desde_archivo(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    @classmethod
+    def desde_vistas(cls, contenido, vistas):
+        """ReceiptImage con las vistas calculadas en otro proceso (ver vistas())."""
+        recibo = cls(contenido)
+        recibo._phash = vistas.get("phash")
+        recibo._miniatura = vistas.get("miniatura")
+        recibo._subida = vistas.get("subida")
+        recibo._tamano = vistas.get("tamano")
+        recibo.calidad = vistas.get("calidad")
+        return recibo
+
+    def vistas(self):
+        """Las vistas ya calculadas, sin objetos PIL, para devolverlas desde el pool de procesos."""
+        return {"phash": self._phash, "miniatura": self._miniatura, "subida": self._subida,
+                "tamano": self._tamano, "calidad": self.calidad}
+
+    @property
+    def abierta(self):
+        if self._abierta is None:
+            self._abierta = Image.open(BytesIO(self.contenido))
+            self._tamano = self._abierta.size
+        return self._abierta
+
+    @property
+    def tamano_original(self):
+        return self.abierta.size if self._tamano is None else self._tamano
+
+    @property
+    def formato(self):
+        return self.abierta.format
+
+    @property
+    def imagen(self):
+        if self._imagen is None:
+            imagen = self.abierta
+            ancho, alto = imagen.size
+            escala = DECODIFICAR_LADO / max(ancho, alto)
+            if imagen.format == "JPEG" and escala < 1:
+                # draft garantiza al menos el tamaño pedido, así que el lado mayor queda >= DECODIFICAR_LADO
+                imagen.draft("RGB", (int(ancho * escala) + 1, int(alto * escala) + 1))
+            imagen.load()
+            self._imagen = imagen
+        return self._imagen
+
+    @property
+    def gris(self):
+        if self._gris is None:
+            imagen = self.imagen
+            self._gris = imagen if imagen.mode == "L" else imagen.convert("L")
+        return self._gris
+
+    @property
+    def phash(self):
+        if self._phash is None:
+            import imagehash
+            self._phash = str(imagehash.phash(self.gris))
+        return self._phash
+
+    @property
+    def miniatura(self):
+        """JPEG reducido a MINIATURA_TAMANO."""
+        if self._miniatura is None:
+            imagen = self.imagen.copy()
+            imagen.thumbnail(MINIATURA_TAMANO, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            buffer = BytesIO()
+            imagen.convert("RGB").save(buffer, format="JPEG", quality=MINIATURA_CALIDAD)
+            self._miniatura = buffer.getvalue()
+        return self._miniatura
+
+    @property
+    def bytes_subida(self):
+        """Bytes que se envían a Vision: reducidos, en gris y recomprimidos si así pesan menos."""
+        if self._subida is None:
+            self._subida = self._preparar_subida()
+        return self._subida
+
+    def _preparar_subida(self):
+        try:
+            ancho, alto = self.abierta.size
+        except Exception:
+            return self.contenido  # que Vision responda con su propio error
+        if len(self.contenido) < OCR_MIN_BYTES_RECOMPRIMIR and max(ancho, alto) <= OCR_MAX_LADO:
+            return self.contenido
+        imagen = self.gris if OCR_ESCALA_GRISES else self.imagen.convert("RGB")
+        if max(imagen.size) > OCR_MAX_LADO:
+            imagen = imagen.copy()
+            imagen.thumbnail((OCR_MAX_LADO, OCR_MAX_LADO), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        buffer = BytesIO()
+        imagen.save(buffer, format="JPEG", quality=OCR_CALIDAD_JPEG, optimize=True)
+        return buffer.getvalue() if buffer.tell() < len(self.contenido) else self.contenido
+
+    def validar(self, registrar=True):
+        """(es_valida, mensaje): formato, imagen no uniforme y el filtro de calidad de quality_gate."""
+        if not self.contenido:
+            return False, "❌ No se pudo obtener el contenido de la imagen."
+        try:
+            formato = self.formato
+        except Exception:
+            return False, "❌ El archivo no es una imagen válida. Por favor, envía un archivo JPG, PNG o WebP."
+        if formato not in BOT_CONFIG['supported_formats']:
+            return False, f"❌ Formato no soportado ({formato}). Por favor, envía una imagen en formato JPG, PNG o WebP."
+        try:
+            minimo, maximo = self.gris.getextrema()
+        except Exception as e:
+            print(f"Error validando imagen: {e}")
+            return False, "❌ Error al validar la imagen. Por favor, intenta con otra imagen."
+        if minimo == maximo:
+            return False, "❌ La imagen parece estar en blanco o muy oscura. Por favor, envía una imagen más clara."
+        es_legible, mensaje, _ = evaluar_calidad(self, registrar)
+        return es_legible, mensaje
+
+# --- PREPARACIÓN EN EL POOL DE PROCESOS ---
+def calcular_vistas(contenido, validar=True):
+    # Corre en un proceso del pool: decodifica, valida y deja calculado todo lo que se usará
+    recibo = ReceiptImage(contenido)
+    es_valida, mensaje = recibo.validar(registrar=False) if validar else (True, "")
+    if es_valida:
+        recibo.phash, recibo.miniatura, recibo.bytes_subida  # quedan memorizadas en vistas()
+    return es_valida, mensaje, recibo.vistas()
+
+def preparar_recibo(contenido, validar=True):
+    """
+    (ReceiptImage, es_valida, mensaje). La decodificación, el filtro de calidad, el phash,
+    la miniatura y la recompresión para Vision corren en el pool de procesos; el
+    ReceiptImage devuelto ya las trae memorizadas.
+    """
+    es_valida, mensaje, vistas = ejecutar_cpu(calcular_vistas, contenido, validar)
+    recibo = ReceiptImage.desde_vistas(contenido, vistas)
+    if recibo.calidad:
+        gate_stats.registrar(*recibo.calidad)
+    return recibo, es_valida, mensaje
@@ -0,0 +1,160 @@
+# services/turnos.py
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- UN TURNO A LA VEZ POR USUARIO ---
+# Dos mensajes seguidos del mismo cliente (el comprobante y su texto, un botón pulsado
+# dos veces) llegaban en hilos distintos de waitress; cada uno hacía cargar_estado ->
+# modificar -> guardar_estado y pisaba lo que había escrito el otro. Ahora el webhook
+# solo deja el mensaje en el buzón de su remitente y responde; un pool de hilos atiende
+# los buzones, con como máximo un hilo por usuario (igual que services/dispatcher.py).
+# Los turnos de un mismo usuario corren de a uno y en orden de llegada, los de usuarios
+# distintos en paralelo, y un turno largo (PDF escaneado, audio) no ocupa ningún hilo
+# de waitress. Con varias instancias, cada turno toma además un lock de Redis por usuario.
+# El backend se elige con TURNOS_BACKEND ("memory" o "redis"); si no se indica, se usa
+# Redis cuando existe REDIS_URL.
+TURNOS_BACKEND = os.getenv("TURNOS_BACKEND", "")
+TURNOS_WORKERS = int(os.getenv("TURNOS_WORKERS", "8"))
+TURNOS_MAX_PENDIENTES = int(os.getenv("TURNOS_MAX_PENDIENTES", "20"))  # por usuario
+TURNO_LEASE_SECONDS = int(os.getenv("TURNO_LEASE_SECONDS", "180"))     # un turno con audio largo o PDF escaneado
+TURNO_ESPERA_MAX_SECONDS = int(os.getenv("TURNO_ESPERA_MAX_SECONDS", "120"))
+
+class BuzonesPorUsuario:
+
+    def __init__(self, redis_client=None, max_workers=TURNOS_WORKERS, max_pendientes=TURNOS_MAX_PENDIENTES,
+                 lease=TURNO_LEASE_SECONDS, espera_max=TURNO_ESPERA_MAX_SECONDS):
+        self._redis = redis_client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="turnos")
+        self.max_pendientes = max_pendientes
+        self.lease = lease
+        self.espera_max = espera_max
+        self._lock = threading.Lock()
+        self._inicio = time.time()
+        self._buzones = {}  # user_id -> deque de (encolado, funcion, args); existe mientras alguien la vacía
+        self.stats = {"recibidos": 0, "atendidos": 0, "fallidos": 0, "descartados": 0, "con_espera": 0,
+                      "pendientes_max": 0, "espera_ms": 0.0, "espera_ms_max": 0.0, "ejecucion_ms": 0.0,
+                      "redis_vencidos": 0, "errores_redis": 0}
+
+    def encolar(self, user_id, funcion, *args):
+        """Deja funcion(*args) en el buzón de user_id y vuelve enseguida. False si el buzón está lleno."""
+        item = (time.perf_counter(), funcion, args)
+        with self._lock:
+            self.stats["recibidos"] += 1
+            buzon = self._buzones.get(user_id)
+            if buzon is not None:
+                if len(buzon) >= self.max_pendientes:
+                    self.stats["descartados"] += 1
+                    print(f"[turnos] {user_id} tiene {len(buzon)} mensajes sin atender; se descarta el nuevo.")
+                    return False
+                buzon.append(item)
+                # Llegó mientras otro turno del mismo usuario corre o espera
+                self.stats["con_espera"] += 1
+                self.stats["pendientes_max"] = max(self.stats["pendientes_max"], len(buzon))
+                return True
+            self._buzones[user_id] = deque([item])
+        self._executor.submit(self._vaciar, user_id)
+        return True
+
+    def _vaciar(self, user_id):
+        while True:
+            with self._lock:
+                buzon = self._buzones[user_id]
+                if not buzon:
+                    del self._buzones[user_id]
+                    return
+                encolado, funcion, args = buzon.popleft()
+            self._atender(user_id, encolado, funcion, args)
+
+    def _atender(self, user_id, encolado, funcion, args):
+        lock_redis = self._tomar_redis(user_id) if self._redis is not None else None
+        inicio = time.perf_counter()
+        espera_ms = (inicio - encolado) * 1000
+        clave = "atendidos"
+        try:
+            funcion(*args)
+        except Exception as e:
+            # Un turno con error no debe impedir los siguientes del mismo usuario
+            print(f"[turnos] Error atendiendo a {user_id}: {e}")
+            clave = "fallidos"
+        finally:
+            if lock_redis is not None:
+                try:
+                    lock_redis.release()
+                except Exception as e:
+                    # El lease venció durante el turno y otra instancia pudo haberlo tomado
+                    print(f"[turnos] No se pudo liberar el lock de Redis de {user_id} ({e}).")
+        ejecucion_ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.stats[clave] += 1
+            self.stats["espera_ms"] += espera_ms
+            self.stats["espera_ms_max"] = max(self.stats["espera_ms_max"], espera_ms)
+            self.stats["ejecucion_ms"] += ejecucion_ms
+
+    def _tomar_redis(self, user_id):
+        # Si Redis no responde o el turno remoto no se libera a tiempo, se sigue igual:
+        # mejor un turno concurrente que un mensaje sin atender.
+        try:
+            lock = self._redis.lock(f"turno:{user_id}", timeout=self.lease, blocking_timeout=self.espera_max)
+            if lock.acquire():
+                return lock
+            print(f"[turnos] {user_id}: el turno en otra instancia no se liberó en {self.espera_max}s; se continúa.")
+            clave = "redis_vencidos"
+        except Exception as e:
+            print(f"[turnos] No se pudo tomar el lock de Redis para {user_id} ({e}).")
+            clave = "errores_redis"
+        with self._lock:
+            self.stats[clave] += 1
+        return None
+
+    def pendientes(self):
+        with self._lock:
+            return sum(len(buzon) for buzon in self._buzones.values())
+
+    def resumen(self):
+        """Turnos atendidos, cuántos llegaron con otro del mismo usuario en curso y cuánto esperaron."""
+        with self._lock:
+            stats = dict(self.stats)
+            activos = len(self._buzones)
+            pendientes = sum(len(buzon) for buzon in self._buzones.values())
+        terminados = (stats["atendidos"] + stats["fallidos"]) or 1
+        return {
+            "backend": "redis" if self._redis is not None else "memory",
+            "usuarios_activos": activos,
+            "pendientes": pendientes,
+            "pendientes_max": stats["pendientes_max"],
+            "recibidos": stats["recibidos"],
+            "atendidos": stats["atendidos"],
+            "fallidos": stats["fallidos"],
+            "descartados": stats["descartados"],
+            "con_espera": stats["con_espera"],
+            "tasa_contencion": round(stats["con_espera"] / stats["recibidos"], 4) if stats["recibidos"] else 0.0,
+            "espera_ms_prom": round(stats["espera_ms"] / terminados, 1),
+            "espera_ms_max": round(stats["espera_ms_max"], 1),
+            "ejecucion_ms_prom": round(stats["ejecucion_ms"] / terminados, 1),
+            "atendidos_por_s": round((stats["atendidos"] + stats["fallidos"]) / max(time.time() - self._inicio, 1), 3),
+            "redis_vencidos": stats["redis_vencidos"],
+            "errores_redis": stats["errores_redis"],
+        }
+
+def crear_turnos(backend=TURNOS_BACKEND):
+    redis_url = os.getenv("REDIS_URL")
+    if not backend:
+        backend = "redis" if redis_url else "memory"
+    if backend == "redis":
+        try:
+            import redis
+            cliente = redis.Redis.from_url(redis_url or "redis://localhost:6379/0")
+            cliente.ping()
+            print("[turnos] Usando Redis para los turnos por usuario.")
+            return BuzonesPorUsuario(cliente)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo usar Redis para los turnos ({e}). Solo se ordenarán en esta instancia.")
+    return BuzonesPorUsuario()
+
+turnos = crear_turnos()
+
+def encolar_turno(user_id, funcion, *args):
+    return turnos.encolar(user_id, funcion, *args)
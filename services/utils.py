@@ -1,8 +1,6 @@
 import os
 import time
 import hashlib
-from io import BytesIO
-from PIL import Image
 
 BOT_CONFIG = {
     'max_messages_per_minute': 10,
@@ -13,6 +11,8 @@ BOT_CONFIG = {
     'cleanup_interval_hours': 24
 }
 
+GRUPO_SOPORTE_ID = os.getenv("GRUPO_SOPORTE_ID")
+
 if not os.getenv("META_ACCESS_TOKEN"):
     raise ValueError("META_ACCESS_TOKEN no está configurado en las variables de entorno")
 
@@ -43,18 +43,19 @@ def cleanup_temp_files():
     except Exception as e:
         print(f"Error en limpieza de archivos temporales: {e}")
 
-def create_image_url_alternative(filepath, user_id):
+def create_image_url_alternative(imagen, user_id):
+    """Referencia corta del comprobante para la hoja; imagen es un ReceiptImage o la ruta de un archivo."""
     try:
-        if not os.path.exists(filepath):
+        if isinstance(imagen, str):
+            if not os.path.exists(imagen):
+                return "Imagen no disponible"
+            from .receipt_image import ReceiptImage
+            imagen = ReceiptImage.desde_archivo(imagen)
+        if imagen is None:
             return "Imagen no disponible"
-        with Image.open(filepath) as img:
-            img.thumbnail((800, 600), Image.Resampling.LANCZOS)
-            buffer = BytesIO()
-            img.convert('RGB').save(buffer, format='JPEG', quality=60)
-            encoded = base64.b64encode(buffer.getvalue())
-            reference = f"temp_ref_{user_id}_{encoded[:20].decode()}"
-            return reference
+        # Hash de la miniatura y no el inicio de su base64, que es la cabecera JPEG y
+        # sale igual en todas las imágenes.
+        return f"temp_ref_{user_id}_{hashlib.sha1(imagen.miniatura).hexdigest()[:20]}"
     except Exception as e:
         print(f"Error creando referencia de imagen: {e}")
         return "Error de referencia"
-
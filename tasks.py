@@ -1,10 +1,6 @@
 # tasks.py
 import os
 from celery import Celery
-from PIL import Image
-from io import BytesIO
-import imagehash
-from google.cloud import vision
 
 # Importamos las funciones que necesitamos de nuestro archivo original
 # ¡OJO! Puede que necesites mover algunas funciones a un archivo `utils.py`
@@ -13,7 +9,7 @@ from app import (
     enviar_mensaje_whatsapp,
     borrar_estado,
     guardar_estado,
-    obtener_hashes_existentes,
+    es_hash_duplicado,
     create_image_url_alternative,
     BotError,
     # Funciones de extracción de datos
@@ -27,6 +23,8 @@ from app import (
     identificar_banco
 )
 from utils_sheets import registrar_pago
+from services.ocr import extraer_texto_comprobante
+from services.receipt_image import ReceiptImage
 
 # Render proveerá la variable de entorno 'REDIS_URL' automáticamente.
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -45,16 +43,12 @@ def process_image_task(from_number, image_content_bytes, state, temp_filepath):
         # Aquí va la MISMA lógica que tenías en `process_payment_image`
         # pero adaptada para recibir el contenido de la imagen directamente.
 
-        client = vision.ImageAnnotatorClient.from_service_account_json("credentials.json")
-        image = vision.Image(content=image_content_bytes)
-        response = client.text_detection(image=image)
-        if response.error.message:
+        recibo = ReceiptImage(image_content_bytes)
+        texto_completo_ocr, ocr_error = extraer_texto_comprobante(recibo)
+        if ocr_error:
             enviar_mensaje_whatsapp(from_number, BotError.ocr_error())
             return
 
-        texts = response.text_annotations
-        texto_completo_ocr = texts[0].description if texts else ""
-
         if not texto_completo_ocr.strip():
             enviar_mensaje_whatsapp(from_number, "📝 No se detectó texto en la imagen.")
             return
@@ -73,8 +67,8 @@ def process_image_task(from_number, image_content_bytes, state, temp_filepath):
             enviar_mensaje_whatsapp(from_number, BotError.wrong_recipient())
             return
 
-        new_hash = imagehash.phash(Image.open(BytesIO(image_content_bytes)))
-        if str(new_hash) in obtener_hashes_existentes():
+        new_hash = recibo.phash
+        if es_hash_duplicado(new_hash):
             enviar_mensaje_whatsapp(from_number, BotError.duplicate_receipt())
             return
         
@@ -86,10 +80,10 @@ def process_image_task(from_number, image_content_bytes, state, temp_filepath):
 
         nombre_cliente = state.get("apellidos_y_nombres", "")
         cedula_cliente = state.get("cedula", "")
-        image_reference = create_image_url_alternative(temp_filepath, from_number)
+        image_reference = create_image_url_alternative(recibo, from_number)
 
         # Registro en Google Sheets
-        success = registrar_pago(nombre_cliente, cedula_cliente, monto_pago, fecha_deposito, num_documento, banco_identificado, image_reference, str(new_hash))
+        success = registrar_pago(nombre_cliente, cedula_cliente, monto_pago, fecha_deposito, num_documento, banco_identificado, image_reference, new_hash)
 
         if success:
             mensaje_exito = (f"🎉 ¡Pago registrado exitosamente!**\n\n"
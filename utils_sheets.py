@@ -5,11 +5,22 @@ utils_sheets.py (firma-robusto)
 - Si el .csv falla, intento abrir como Excel (xlsx renombrado).
 - Mantiene: detectar encabezado "SERVICIO", nombre=APELLIDOS+NOMBRES,
   suma de meses, cédula como texto, consultar_deuda, registrar_pago, obtener_hashes_existentes.
+- Los pagos se guardan en un libro SQLite (services/ledger.py); el CSV se migra solo.
+- Los hashes de pagos se indexan en memoria (multi-index hashing) para detectar comprobantes
+  duplicados o casi idénticos con es_hash_duplicado.
+- La tabla de deudas normalizada se cachea en memoria y solo se recarga si cambia
+  el mtime o el tamaño del archivo fuente.
+- La carga de esa tabla corre en el pool de procesos (services/cpu_pool.py) para no
+  retener el GIL de los hilos que atienden el webhook.
 """
 
-import os, csv, unicodedata
+import os, unicodedata, threading
 from datetime import datetime
 
+from services.ledger import CsvLedger, SqliteLedger
+from services.phash_index import PhashIndex
+from services.cpu_pool import ejecutar_cpu
+
 def _normalize_cols(df):
     df = df.copy()
     df.columns = [str(c).strip().lower() for c in df.columns]
@@ -63,11 +74,11 @@ def _is_probably_xlsx(path):
     except Exception:
         return False
 
-def _load_deuda_df():
+def _load_deuda_df(directorio="."):
     import pandas as pd
 
-    path_xlsx = "deuda_clientes.xlsx"
-    path_csv  = "deuda_clientes.csv"
+    path_xlsx = os.path.join(directorio, "deuda_clientes.xlsx")
+    path_csv  = os.path.join(directorio, "deuda_clientes.csv")
 
     df_raw = None
     used = None
@@ -156,9 +167,60 @@ def _load_deuda_df():
     print(f"[deudas] Fuente usada: {used} | Registros: {len(df)}")
     return df, mes_cols
 
+# ---------------------- Caché de la tabla de deudas ----------------------
+_DEUDA_PATHS = ("deuda_clientes.xlsx", "deuda_clientes.csv")
+_deuda_cache = {"firma": None, "df": None, "mes_cols": None, "por_cedula": None}
+_deuda_lock = threading.Lock()
+
+def _firma_deuda():
+    # (mtime, tamaño) de cada archivo candidato; None si no existe
+    firma = []
+    for path in _DEUDA_PATHS:
+        try:
+            st = os.stat(path)
+            firma.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            firma.append(None)
+    return tuple(firma)
+
+def _cargar_tabla_deuda(directorio):
+    # Corre en el pool de procesos: lectura, normalización e índice por cédula retienen el GIL
+    df, mes_cols = _load_deuda_df(directorio)
+    df = df.reset_index(drop=True)
+    df["_nombre_norm"] = df["nombre"].map(_strip_accents_lower)
+    por_cedula = {}
+    for pos, ced in enumerate(df["cedula"].astype(str).str.strip()):
+        por_cedula.setdefault(ced, pos)
+    return df, mes_cols, por_cedula
+
+def _get_deuda_table():
+    """
+    Devuelve (df, mes_cols, por_cedula) desde la caché; solo vuelve a leer el
+    archivo cuando cambia su firma. por_cedula mapea cédula -> posición de la
+    primera fila con esa cédula.
+    """
+    firma = _firma_deuda()
+    cache = _deuda_cache
+    if cache["firma"] == firma and cache["df"] is not None:
+        return cache["df"], cache["mes_cols"], cache["por_cedula"]
+    with _deuda_lock:
+        if cache["firma"] != firma or cache["df"] is None:
+            # Los procesos del pool no siguen los chdir del padre: se pasa el directorio actual
+            df, mes_cols, por_cedula = ejecutar_cpu(_cargar_tabla_deuda, os.getcwd())
+            cache.update(firma=firma, df=df, mes_cols=mes_cols, por_cedula=por_cedula)
+        return cache["df"], cache["mes_cols"], cache["por_cedula"]
+
+def _formatear_deuda(fila, mes_cols):
+    detalle = ""
+    if mes_cols:
+        meses_pos = [f"{m.capitalize()}: {float(fila[m]):.2f}" for m in mes_cols if float(fila[m]) > 0]
+        if meses_pos:
+            detalle = "\n📆 " + " | ".join(meses_pos)
+    return f"👤 Cliente: {fila.get('nombre','')}\n🆔 Cédula: {fila.get('cedula','')}\n💰 Deuda total: ${float(fila.get('deuda',0)):.2f}{detalle}"
+
 def consultar_deuda(cedula_o_nombre):
     try:
-        df, mes_cols = _load_deuda_df()
+        df, mes_cols, por_cedula = _get_deuda_table()
     except Exception as e:
         print(f"[consultar_deuda] Error: {e}")
         return "⚠️ No se pudo cargar la base de deudas. Verifica el archivo."
@@ -167,58 +229,84 @@ def consultar_deuda(cedula_o_nombre):
     if not q:
         return "⚠️ Ingresa una cédula o nombre."
 
-    by_id = df[df["cedula"].astype(str).str.strip() == q]
-    if not by_id.empty:
-        fila = by_id.iloc[0]
-        detalle = ""
-        if mes_cols:
-            meses_pos = [f"{m.capitalize()}: {float(fila[m]):.2f}" for m in mes_cols if float(fila[m]) > 0]
-            if meses_pos:
-                detalle = "\n📆 " + " | ".join(meses_pos)
-        return f"👤 Cliente: {fila.get('nombre','')}\n🆔 Cédula: {fila.get('cedula','')}\n💰 Deuda total: ${float(fila.get('deuda',0)):.2f}{detalle}"
+    pos = por_cedula.get(q)
+    if pos is not None:
+        return _formatear_deuda(df.iloc[pos], mes_cols)
 
     qn = _strip_accents_lower(q)
-    df["_nombre_norm"] = df["nombre"].map(_strip_accents_lower)
-    hits = df[df["_nombre_norm"].str.contains(qn, na=False)]
+    hits = df[df["_nombre_norm"].str.contains(qn, na=False, regex=False)]
     if not hits.empty:
-        fila = hits.iloc[0]
-        detalle = ""
-        if mes_cols:
-            meses_pos = [f"{m.capitalize()}: {float(fila[m]):.2f}" for m in mes_cols if float(fila[m]) > 0]
-            if meses_pos:
-                detalle = "\n📆 " + " | ".join(meses_pos)
-        return f"👤 Cliente: {fila.get('nombre','')}\n🆔 Cédula: {fila.get('cedula','')}\n💰 Deuda total: ${float(fila.get('deuda',0)):.2f}{detalle}"
+        return _formatear_deuda(hits.iloc[0], mes_cols)
 
     return "❌ No se encontró deuda para ese cliente."
 
 # ---------------------- Registro de pagos ----------------------
+# El libro de pagos vive en SQLite (pagos.db). Con PAGOS_BACKEND=csv se sigue usando
+# pagos_registrados.csv. Al crear la base por primera vez se migra el CSV existente.
 _PAGOS_PATH = "pagos_registrados.csv"
-_PAGOS_FIELDS = ["ts","nombre","cedula","monto","fecha","documento","banco","image_ref","hash"]
+_PAGOS_DB_PATH = os.getenv("PAGOS_DB_PATH", "pagos.db")
+_PAGOS_BACKEND = os.getenv("PAGOS_BACKEND", "sqlite").strip().lower()
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger():
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                if _PAGOS_BACKEND == "csv":
+                    _ledger = CsvLedger(_PAGOS_PATH)
+                else:
+                    ledger = SqliteLedger(_PAGOS_DB_PATH)
+                    if ledger.esta_vacio() and os.path.exists(_PAGOS_PATH):
+                        n = ledger.migrar_desde_csv(_PAGOS_PATH)
+                        print(f"[pagos] Migrados {n} pagos desde {_PAGOS_PATH} a {_PAGOS_DB_PATH}.")
+                    _ledger = ledger
+    return _ledger
 
-def _ensure_pagos_file():
-    if not os.path.exists(_PAGOS_PATH):
-        with open(_PAGOS_PATH, "w", encoding="utf-8-sig", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=_PAGOS_FIELDS)
-            w.writeheader()
+# Índice de hashes en memoria: se carga una vez y luego solo se le agregan los pagos
+# nuevos del libro (incluidos los que registre otro proceso, p. ej. el worker de Celery).
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+_pagos_index = {"cursor": None, "index": None}
+_pagos_lock = threading.RLock()
+
+def _get_pagos_index():
+    with _pagos_lock:
+        hashes, cursor, completo = get_ledger().cambios_desde(_pagos_index["cursor"])
+        if completo or _pagos_index["index"] is None:
+            _pagos_index["index"] = PhashIndex(hashes, PHASH_MAX_DISTANCE)
+        else:
+            for h in hashes:
+                _pagos_index["index"].agregar(h)
+        _pagos_index["cursor"] = cursor
+        return _pagos_index["index"]
 
 def obtener_hashes_existentes():
-    _ensure_pagos_file()
-    hashes = set()
     try:
-        with open(_PAGOS_PATH, "r", encoding="utf-8-sig", newline="") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                h = (row.get("hash") or "").strip()
-                if h:
-                    hashes.add(h)
+        return set(_get_pagos_index().exactos)
     except Exception as e:
         print(f"[obtener_hashes_existentes] Error: {e}")
-    return hashes
+        return set()
+
+def es_hash_duplicado(img_hash, max_distancia=PHASH_MAX_DISTANCE):
+    """True si ya hay un pago con ese phash o con uno a distancia de Hamming <= max_distancia."""
+    try:
+        return _get_pagos_index().contiene(img_hash, max_distancia)
+    except Exception as e:
+        print(f"[es_hash_duplicado] Error: {e}")
+        return False
+
+def historial_pagos(cedula, limite=10):
+    try:
+        return get_ledger().historial(_to_str_id(cedula), limite)
+    except Exception as e:
+        print(f"[historial_pagos] Error: {e}")
+        return []
 
 def registrar_pago(nombre, cedula, monto, fecha, documento, banco, image_ref, img_hash):
     try:
-        _ensure_pagos_file()
-        if img_hash and img_hash in obtener_hashes_existentes():
+        if img_hash and es_hash_duplicado(img_hash):
             print("[registrar_pago] Duplicado por hash, no se registra.")
             return False
         from datetime import datetime as _dt
@@ -233,9 +321,10 @@ def registrar_pago(nombre, cedula, monto, fecha, documento, banco, image_ref, im
             "image_ref": (image_ref or "").strip(),
             "hash": (str(img_hash) or "").strip(),
         }
-        with open(_PAGOS_PATH, "a", encoding="utf-8-sig", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=_PAGOS_FIELDS)
-            w.writerow(row)
+        # El UNIQUE del libro resuelve la carrera entre dos registros simultáneos del mismo hash
+        if not get_ledger().registrar(row):
+            print("[registrar_pago] Duplicado por hash, no se registra.")
+            return False
         return True
     except Exception as e:
         print(f"[registrar_pago] Error: {e}")